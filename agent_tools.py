@@ -1,7 +1,16 @@
 import os
+import ast
 import json
+import operator
+import functools
+import hashlib
+import html
+import httpx
+import orjson
 import requests
-from openai import OpenAI
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 from datetime import datetime, timedelta, timezone
 import pickle
@@ -9,29 +18,287 @@ from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+from googleapiclient.model import JsonModel
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
 from google.oauth2.credentials import Credentials
-import pytz
 from playwright.async_api import async_playwright
 import re
 import asyncio
+import inspect
+import itertools
+import logging
+import math
+import threading
+import time
+import types
+import string
+import textwrap
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from zoneinfo import ZoneInfo
 
 # 加载环境变量
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# 配置项 - 导入时读取一次，运行时不再反复查询环境变量
+ARK_API_KEY = os.environ.get("ARK_API_KEY")
+BREVO_API_KEY = os.environ.get("BREVO_API_KEY")
+BREVO_SENDER_EMAIL = os.environ.get("BREVO_SENDER_EMAIL")
+BREVO_SENDER_NAME = os.environ.get("BREVO_SENDER_NAME", "智能助手")
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", "300"))
+LLM_CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", "2048"))
+# 用户输入长度上限（字符数）- 超长输入在本地直接拒绝，不浪费一次LLM往返
+MAX_INPUT_CHARS = int(os.environ.get("MAX_INPUT_CHARS", "8000"))
+# 方舟请求的重试次数 - 高峰期429较常见，比SDK默认的2次多给几次机会
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "4"))
+
+# 收件人邮箱格式 - 在调用邮件API之前拦截明显错误的地址
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+# 快速通道 - 纯算式和"XX天气"这类意图明确的输入无需经过LLM
+# 算式至少含一个 + * / 运算符：只有"-"连接的数字多半是电话号码或日期（138-1234-5678、2024-10）；
+# 形如 10/1、2024/10/01 的输入多半是日期，同样交给LLM
+_QUICK_CALC_RE = re.compile(
+    r"(?!\d{4}-\d{1,2}-\d{1,2})(?!\d+/\d+(?:/\d+)?$)(?=.*[+*/])"
+    r"[\d+\-*/().\s]*\d\s*[-+*/]\s*[\d(][\d+\-*/().\s]*"
+)
+_QUICK_WEATHER_RE = re.compile(r"(?:查询|查)?([^\s\d的，,。？?]{2,6}?)(?:的)?天气[？?]?")
+# 只有已知城市才走天气快速通道；"这里天气""国庆天气"之类交给LLM处理（默认北京）
+_QUICK_WEATHER_CITIES = frozenset((
+    "北京", "上海", "天津", "重庆", "香港", "澳门", "台北",
+    "哈尔滨", "长春", "沈阳", "大连", "呼和浩特", "石家庄", "太原", "济南", "青岛", "郑州", "西安",
+    "兰州", "西宁", "银川", "乌鲁木齐", "拉萨", "成都", "贵阳", "昆明", "南宁", "海口", "三亚",
+    "广州", "深圳", "珠海", "东莞", "佛山", "厦门", "福州", "泉州", "南昌", "长沙", "武汉",
+    "合肥", "南京", "苏州", "无锡", "常州", "杭州", "宁波", "温州", "绍兴",
+))
+
+# Brevo邮件接口 - 地址、请求头和HTML模板只构建一次
+BREVO_API_URL = "https://api.brevo.com/v3/smtp/email"
+_BREVO_HEADERS = {
+    "accept": "application/json",
+    "content-type": "application/json",
+    "api-key": BREVO_API_KEY or ""
+}
+_BREVO_HTML_TMPL = string.Template(textwrap.dedent("""\
+    <div style="font-family: Arial, sans-serif; line-height: 1.6;">
+        <h2>$subject</h2>
+        <div style="white-space: pre-line; padding: 20px; background: #f9f9f9; border-radius: 5px;">
+            $body
+        </div>
+        <p style="color: #999; font-size: 12px; margin-top: 20px;">
+            此邮件由智能助手自动发送
+        </p>
+    </div>
+"""))
+
+# 共享HTTP会话 - 复用TCP/TLS连接，避免每次请求天气/邮件接口都重新握手
+# 重试只作用于幂等请求（GET等），邮件POST不会被重复发送
+_HTTP_SESSION = requests.Session()
+_HTTP_SESSION.headers["User-Agent"] = "dingtalk-bot/1.0"
+_HTTP_ADAPTER = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504])
+)
+_HTTP_SESSION.mount("http://", _HTTP_ADAPTER)
+_HTTP_SESSION.mount("https://", _HTTP_ADAPTER)
+
+# Brevo专用适配器（前缀更长，优先匹配）：429说明请求未被处理，POST重试不会重复发信
+# 读超时不重试（read=0），避免服务端已受理但响应丢失时重复发送
+_HTTP_SESSION.mount("https://api.brevo.com/", HTTPAdapter(
+    pool_maxsize=8,
+    max_retries=Retry(
+        total=3,
+        read=0,
+        backoff_factor=0.2,
+        status_forcelist=[429],
+        allowed_methods=frozenset({"POST"}),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+))
+
+# 邮件发送线程池 - 邮件在后台发送，不阻塞对话响应
+_MAIL_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="mailer")
+
+# 火山方舟（豆包）接口地址
+ARK_BASE_URL = "https://ark.cn-beijing.volces.com/api/v3/bots"
+
+# 限制同时进行的LLM请求数量，避免突发流量触发方舟限流
+_LLM_SEMAPHORE = asyncio.Semaphore(5)
+# 股票报告单次生成可达数分钟，单独限流，不占用对话请求的名额
+_REPORT_SEMAPHORE = asyncio.Semaphore(2)
+
+
+@functools.lru_cache(maxsize=1)
+def get_ark_client():
+    """获取共享的方舟异步客户端 - 所有Agent复用同一个连接池，避免重复TLS握手"""
+    # 方舟支持HTTP/2：并发请求在同一连接上多路复用，请求头经HPACK压缩
+    http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        # 股票报告生成耗时较长，读超时保持与SDK默认一致
+        timeout=httpx.Timeout(600.0, connect=5.0)
+    )
+    return AsyncOpenAI(
+        base_url=ARK_BASE_URL,
+        api_key=ARK_API_KEY,
+        http_client=http_client,
+        # SDK自带指数退避+抖动重试（429/5xx/超时/连接错误），并遵循Retry-After；默认只重试2次
+        max_retries=LLM_MAX_RETRIES
+    )
+
+
+class _LRUCache:
+    """线程安全的LRU缓存，可选过期时间ttl（秒）"""
+
+    def __init__(self, maxsize=256, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None, allow_stale=False):
+        """读取缓存；allow_stale=True 时过期条目也会返回（用于上游故障时兜底）"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            stored_at, value = entry
+            if not allow_stale and self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# 纯文本回答缓存 - 重复提问直接返回，跳过LLM调用（工具调用有副作用，从不缓存）
+# 键为模型ID+完整消息的哈希，换模型或改提示词后旧回答自动失效
+_RESPONSE_CACHE = _LRUCache(maxsize=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL)
+
+
+class _SingleFlight:
+    """合并并发的相同请求：同一key同一时刻只执行一次，其余调用者等待并共享结果"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+
+# 计算器允许出现的字符
+_CALC_ALLOWED_CHARS = frozenset("+-*/(). 0123456789")
+
+# 计算器支持的运算
+_CALC_BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+_CALC_UNARY_OPS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+# 幂运算结果的位数上限 - 大整数运算持有GIL，放到线程里也会卡住整个事件循环
+_CALC_MAX_POW_BITS = 10_000
+
+
+def _eval_calc_node(node):
+    """递归计算算术表达式的语法树节点，只允许数字和四则/幂运算"""
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in _CALC_BINARY_OPS:
+        left = _eval_calc_node(node.left)
+        right = _eval_calc_node(node.right)
+        # 在计算之前按 right * log2(|left|) 估算结果位数，嵌套幂如 ((9**99)**99)**99 也会被拦下
+        if (isinstance(node.op, ast.Pow) and right > 0 and abs(left) > 1
+                and right * math.log2(abs(left)) > _CALC_MAX_POW_BITS):
+            raise ValueError("计算结果过大")
+        return _CALC_BINARY_OPS[type(node.op)](left, right)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _CALC_UNARY_OPS:
+        return _CALC_UNARY_OPS[type(node.op)](_eval_calc_node(node.operand))
+    raise ValueError(f"不支持的表达式: {type(node).__name__}")
+
+
+@functools.lru_cache(maxsize=256)
+def _evaluate_expression(expression):
+    """解析并计算算术表达式，相同表达式直接复用结果"""
+    return _eval_calc_node(ast.parse(expression.strip(), mode="eval").body)
+
+
+def _quick_calc_expression(text):
+    """判断输入是否为可直接计算的算式，是则返回算式，否则返回None交给LLM"""
+    if not _QUICK_CALC_RE.fullmatch(text):
+        return None
+    try:
+        # 括号不配对、01这类前导零等无法解析的输入不当作算式
+        ast.parse(text.strip(), mode="eval")
+    except SyntaxError:
+        return None
+    return text
+
+
+def _quick_weather_city(text):
+    """判断输入是否为"已知城市+天气"，是则返回城市名，否则返回None交给LLM"""
+    match = _QUICK_WEATHER_RE.fullmatch(text)
+    if match and match.group(1) in _QUICK_WEATHER_CITIES:
+        return match.group(1)
+    return None
+
+
+@functools.lru_cache(maxsize=2048)
+def _parse_dt(value, fmt="%Y-%m-%d %H:%M"):
+    """解析日期时间字符串；datetime不可变，相同输入直接复用解析结果"""
+    return datetime.strptime(value, fmt)
+
+
+# 天气缓存 - 天气变化缓慢，同一城市10分钟内直接返回缓存结果
+_WEATHER_CACHE = _LRUCache(maxsize=512, ttl=600)
+_WEATHER_FLIGHT = _SingleFlight()
+
 
 class StockAnalysisPDFAgent:
     """股票分析PDF生成器 - 纯内存操作"""
 
-    def __init__(self):
-        # 豆包客户端配置
-        self.doubao_client = OpenAI(
-            base_url="https://ark.cn-beijing.volces.com/api/v3/bots",
-            api_key=os.environ.get("ARK_API_KEY")
-        )
-        self.model_id = "bot-20250907084333-cbvff"
-
-        # 系统提示词 - AI金融分析师角色
-        self.system_prompt = """你是一位顶级的金融分析师，你的任务是为客户撰写一份专业、深入、数据驱动且观点明确的股票研究报告。你的分析必须客观、严谨，并结合基本面、技术面和市场情绪进行综合判断。每个部份不超过200字。
+    # 系统提示词 - AI金融分析师角色（类级常量，所有实例共享）
+    system_prompt = """你是一位顶级的金融分析师，你的任务是为客户撰写一份专业、深入、数据驱动且观点明确的股票研究报告。你的分析必须客观、严谨，并结合基本面、技术面和市场情绪进行综合判断。每个部份不超过200字。
 
 请严格遵循以下结构和要求，生成一份完整的HTML格式的股票分析报告：
 
@@ -75,9 +342,14 @@ HTML格式要求：
 
 重要：直接输出完整的HTML代码，不要包含任何代码块标记（如```html或```）"""
 
+    def __init__(self, client=None):
+        # 豆包客户端配置
+        self.doubao_client = client or get_ark_client()
+        self.model_id = "bot-20250907084333-cbvff"
+
     def clean_html_content(self, html_content):
         """清理HTML内容中的代码块标记和其他不需要的字符"""
-        print("🧹 清理HTML内容中的代码块标记...")
+        logger.debug("🧹 清理HTML内容中的代码块标记...")
 
         # 移除代码块标记
         cleaned_content = re.sub(r'^```html\s*', '', html_content)
@@ -90,7 +362,7 @@ HTML格式要求：
             # 包装成完整的专业金融报告HTML结构
             cleaned_content = self.wrap_financial_report_html(cleaned_content)
 
-        print(f"✅ HTML内容清理完成，长度: {len(cleaned_content)} 字符")
+        logger.debug("✅ HTML内容清理完成，长度: %s 字符", len(cleaned_content))
         return cleaned_content
 
     def wrap_financial_report_html(self, content):
@@ -274,135 +546,278 @@ HTML格式要求：
 </body>
 </html>"""
 
-    def get_html_from_doubao(self, stock_name_or_code):
-        """从豆包获取股票分析HTML报告"""
-        print(f"📝 请求豆包生成 {stock_name_or_code} 的股票分析报告...")
+    async def get_html_from_doubao(self, stock_name_or_code):
+        """从豆包获取股票分析HTML报告（异步版本）"""
+        logger.debug("📝 请求豆包生成 %s 的股票分析报告...", stock_name_or_code)
     
         user_prompt = f"请为股票 '{stock_name_or_code}' 生成一份完整的专业股票分析报告。"
     
         try:
-            response = self.doubao_client.chat.completions.create(
-                model=self.model_id,
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                max_tokens=15000,
-                temperature=0.3
-            )
+            async with _REPORT_SEMAPHORE:
+                response = await self.doubao_client.chat.completions.create(
+                    model=self.model_id,
+                    messages=[
+                        {"role": "system", "content": self.system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    max_tokens=15000,
+                    temperature=0.3
+                )
             html_content = response.choices[0].message.content.strip()
-            print(f"✅ 生成HTML报告（{len(html_content)} 字符）")
+            logger.info("✅ 生成HTML报告（%s 字符）", len(html_content))
     
             # 清理HTML内容
             cleaned_html = self.clean_html_content(html_content)
             return cleaned_html
     
         except Exception as e:
-            print(f"❌ 豆包调用失败: {str(e)}")
+            logger.error("❌ 豆包调用失败: %s", e)
             # 如果是API错误，可能有更详细的错误信息
             if hasattr(e, 'response'):
-                print(f"🔧 API响应详情: {e.response}")
+                logger.debug("🔧 API响应详情: %s", e.response)
             return None
 
     async def html_to_pdf(self, html_content):
         """
         使用Playwright将HTML转换为PDF二进制数据（异步版本）
         """
-        print("📄 启动浏览器，转换HTML为PDF...")
+        logger.debug("📄 启动浏览器，转换HTML为PDF...")
     
         try:
-            # 添加浏览器路径检查
-            import os
-            from playwright.async_api import async_playwright
-            
-            print(f"🔍 检查Playwright浏览器路径...")
+            logger.debug("🔍 检查Playwright浏览器路径...")
             
             async with async_playwright() as p:
                 # 检查可用的浏览器类型
-                print(f"🔍 可用浏览器: {p.chromium, p.firefox, p.webkit}")
+                logger.debug("🔍 可用浏览器: %s", (p.chromium, p.firefox, p.webkit))
                 
                 # 启动浏览器
-                print("🚀 启动Chromium浏览器...")
+                logger.debug("🚀 启动Chromium浏览器...")
                 browser = await p.chromium.launch(
                     headless=True,
                     args=['--no-sandbox', '--disable-dev-shm-usage']
                 )
                 
-                page = await browser.new_page()
-                await page.set_viewport_size({"width": 1200, "height": 1697})
-                await page.set_content(html_content, wait_until='networkidle')
-    
-                # 生成PDF
-                pdf_options = {
-                    "format": 'A4',
-                    "print_background": True,
-                    "margin": {"top": "0.5in", "right": "0.5in", "bottom": "0.5in", "left": "0.5in"},
-                    "display_header_footer": False,
-                    "prefer_css_page_size": True
-                }
-    
-                pdf_data = await page.pdf(**pdf_options)
-                await browser.close()
-    
-                print(f"✅ PDF二进制数据生成成功，大小: {len(pdf_data)} 字节")
+                try:
+                    page = await browser.new_page()
+                    await page.set_viewport_size({"width": 1200, "height": 1697})
+                    await page.set_content(html_content, wait_until='networkidle')
+
+                    # 生成PDF
+                    pdf_options = {
+                        "format": 'A4',
+                        "print_background": True,
+                        "margin": {"top": "0.5in", "right": "0.5in", "bottom": "0.5in", "left": "0.5in"},
+                        "display_header_footer": False,
+                        "prefer_css_page_size": True
+                    }
+
+                    pdf_data = await page.pdf(**pdf_options)
+                finally:
+                    # 无论成功与否都只在这里关闭一次浏览器
+                    await browser.close()
+
+                logger.info("✅ PDF二进制数据生成成功，大小: %s 字节", len(pdf_data))
                 return pdf_data
     
         except Exception as e:
-            print(f"❌ PDF生成失败: {e}")
-            # 添加更详细的错误信息
-            import traceback
-            print(f"📋 详细错误信息: {traceback.format_exc()}")
+            # logger.exception会附带完整的堆栈信息
+            logger.exception("❌ PDF生成失败: %s", e)
             return None
 
     async def generate_stock_report(self, stock_name_or_code):
         """生成股票分析报告的主方法（异步版本）"""
-        print(f"🎯 开始生成 {stock_name_or_code} 的分析报告...")
+        logger.debug("🎯 开始生成 %s 的分析报告...", stock_name_or_code)
 
         # 获取HTML内容
-        html_content = self.get_html_from_doubao(stock_name_or_code)
+        html_content = await self.get_html_from_doubao(stock_name_or_code)
         if html_content:
-            print(f"✅ 成功获取HTML内容，长度: {len(html_content)} 字符")
+            logger.info("✅ 成功获取HTML内容，长度: %s 字符", len(html_content))
             # 转换为PDF二进制数据
             pdf_binary = await self.html_to_pdf(html_content)
             if pdf_binary:
-                print(f"✅ {stock_name_or_code} 分析报告生成成功！PDF大小: {len(pdf_binary)} 字节")
+                logger.info("✅ %s 分析报告生成成功！PDF大小: %s 字节", stock_name_or_code, len(pdf_binary))
                 return pdf_binary
             else:
-                print(f"❌ {stock_name_or_code} PDF转换失败")
+                logger.error("❌ %s PDF转换失败", stock_name_or_code)
                 return None
         else:
-            print(f"❌ 无法获取 {stock_name_or_code} 的HTML内容，可能是豆包API调用失败")
+            logger.error("❌ 无法获取 %s 的HTML内容，可能是豆包API调用失败", stock_name_or_code)
             return None
 
 
+# 北京时区 - 固定UTC+8，无夏令时，直接replace(tzinfo=...)即可本地化
+BEIJING_TZ = ZoneInfo('Asia/Shanghai')
+
+# Google令牌文件 - JSON格式；旧版pickle文件仅用于一次性迁移
+TOKEN_FILE = 'token.json'
+LEGACY_TOKEN_FILE = 'token.pickle'
+
+# 批量请求并发执行的线程池 - 并发数保持在Google单用户并发配额之下
+_GOOGLE_BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=5, thread_name_prefix="google-batch")
+
+# 单个批量请求最多包含的子请求数 - Tasks上限100；Calendar官方建议不超过50，超出易触发限流
+_TASKS_BATCH_SIZE = 100
+_CALENDAR_BATCH_SIZE = 50
+
+# 常见的固定错误结果 - 只读共享，无需每次构建
+_ERR_NO_TASK_SERVICE = types.MappingProxyType({"success": False, "error": "❌ 任务服务未初始化"})
+_ERR_NO_TASK_LIST = types.MappingProxyType({"success": False, "error": "❌ 无法获取任务列表"})
+_ERR_NO_CALENDAR_SERVICE = types.MappingProxyType({"success": False, "error": "❌ 日历服务未初始化"})
+
+# 只读空映射 - 缺少扩展属性时复用，避免每个事件都新建空字典
+_EMPTY_MAPPING = types.MappingProxyType({})
+
+# 查询日历事件时只请求用到的字段（partial response）
+_EVENT_LIST_FIELDS = "items(id,summary,description,start,end,extendedProperties/private)"
+
+
+class _ThreadLocalAuthorizedHttp:
+    """
+    按线程复用的Google API连接
+
+    httplib2.Http不是线程安全的，而工具调用运行在多个工作线程中；
+    每个线程持有一个带认证的长连接，日历和任务服务共享，避免每次请求重新握手
+    """
+
+    def __init__(self, credentials, timeout=30):
+        self.credentials = credentials
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def get(self):
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = self._local.http = AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=self.timeout))
+        return http
+
+    def build_request(self, http, *args, **kwargs):
+        """供build(requestBuilder=...)使用：忽略默认http，改用当前线程的连接"""
+        return HttpRequest(self.get(), *args, **kwargs)
+
+
+class _OrjsonModel(JsonModel):
+    """使用orjson解析响应体的JsonModel，列表类大响应解析更快
+
+    请求体仍沿用JsonModel.serialize：其输出把非ASCII字符转义为\\uXXXX，
+    httplib2/http.client按latin-1编码字符串请求体，原样的中文标题会直接报错
+    """
+
+    def deserialize(self, content):
+        try:
+            body = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # 与JsonModel一致：非JSON内容原样返回
+            return content.decode("utf-8") if isinstance(content, bytes) else content
+        if self._data_wrapper and isinstance(body, dict) and "data" in body:
+            body = body["data"]
+        return body
+
+
+_GOOGLE_JSON_MODEL = _OrjsonModel()
+
+
+@functools.cache
+def _google_client_config():
+    """Google OAuth客户端配置 - 环境变量只读取一次"""
+    return {
+        "installed": {
+            "client_id": os.environ.get("GOOGLE_CLIENT_ID", ""),
+            "project_id": os.environ.get("GOOGLE_PROJECT_ID", ""),
+            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+            "token_uri": "https://oauth2.googleapis.com/token",
+            "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+            "client_secret": os.environ.get("GOOGLE_CLIENT_SECRET", ""),
+            "redirect_uris": [os.environ.get("GOOGLE_REDIRECT_URIS", "http://localhost")]
+        }
+    }
+
+
+def _with_task_list(method):
+    """
+    任务方法装饰器：检查任务服务并解析默认任务列表ID，作为第一个参数传入被装饰方法；
+    任一步失败时直接返回错误结果。
+
+    任务列表ID缓存在实例上，列表被删除后所有请求都会404：操作失败时重新解析一次，
+    ID变了说明缓存已失效，用新ID重试一次
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self.tasks_service:
+            return _ERR_NO_TASK_SERVICE
+        task_list_id = self.get_or_create_default_task_list()
+        if not task_list_id:
+            return _ERR_NO_TASK_LIST
+        result = method(self, task_list_id, *args, **kwargs)
+        if result.get("success"):
+            return result
+
+        self.invalidate_task_list_cache()
+        fresh_id = self.get_or_create_default_task_list()
+        if not fresh_id or fresh_id == task_list_id:
+            return result
+        logger.warning("⚠️ 默认任务列表已失效，改用 %s 重试", fresh_id)
+        return method(self, fresh_id, *args, **kwargs)
+
+    return wrapper
+
+
 class GoogleCalendarManager:
     """Google日历管理器 - 支持本地credentials.json认证"""
 
+    # 任务优先级与API取值的映射
+    _TASK_PRIORITY_TO_API = {"low": "1", "medium": "3", "high": "5"}
+    _TASK_PRIORITY_FROM_API = {"1": "low", "3": "medium", "5": "high"}
+
     def __init__(self):
         # 权限范围 - 包含Tasks API
         self.SCOPES = [
             'https://www.googleapis.com/auth/calendar',
             'https://www.googleapis.com/auth/tasks'
         ]
-        self.beijing_tz = pytz.timezone('Asia/Shanghai')  # 北京时区
+        self.beijing_tz = BEIJING_TZ  # 北京时区
+        self._http_pool = None
+        self._default_task_list_id = None
+        # 查询结果短期缓存 - 吸收"先查询再操作"这类连续的相同查询，任何修改操作后清空
+        self._query_cache = _LRUCache(maxsize=32, ttl=15)
+        self._tasks_service = None
         self.service = self._authenticate()
-        if self.service:
-            self.tasks_service = build('tasks', 'v1', credentials=self.service._http.credentials)
-        else:
-            self.tasks_service = None
+
+    @property
+    def tasks_service(self):
+        """任务服务 - 首次使用时才构建，只用到日历的流程无需初始化"""
+        if self._tasks_service is None and self.service:
+            self._tasks_service = build('tasks', 'v1', credentials=self._http_pool.credentials,
+                                        requestBuilder=self._http_pool.build_request,
+                                        model=_GOOGLE_JSON_MODEL,
+                                        static_discovery=True, cache_discovery=False)
+        return self._tasks_service
 
     def _authenticate(self):
         """Google日历认证 - 优先使用本地credentials.json"""
         creds = None
+        # 令牌是否来自本地文件；来自环境变量时不落盘，否则本地文件会盖过之后轮换的环境变量
+        from_file = False
+
+        # 方案1: 从本地token.json文件加载（开发环境优先）
+        if os.path.exists(TOKEN_FILE):
+            try:
+                with open(TOKEN_FILE, 'r', encoding='utf-8') as token:
+                    creds = Credentials.from_authorized_user_info(json.load(token), self.SCOPES)
+                from_file = True
+                logger.info("✅ 从本地%s加载令牌成功", TOKEN_FILE)
+            except Exception as e:
+                logger.error("❌ 从%s加载令牌失败: %s", TOKEN_FILE, e)
 
-        # 方案1: 从本地token.pickle文件加载（开发环境优先）
-        if os.path.exists('token.pickle'):
+        # 兼容旧版token.pickle：读取一次后转存为JSON
+        if not creds and os.path.exists(LEGACY_TOKEN_FILE):
             try:
-                with open('token.pickle', 'rb') as token:
+                with open(LEGACY_TOKEN_FILE, 'rb') as token:
                     creds = pickle.load(token)
-                print("✅ 从本地token.pickle加载令牌成功")
+                from_file = True
+                self._save_token(creds)
+                logger.info("✅ 已将%s迁移为%s", LEGACY_TOKEN_FILE, TOKEN_FILE)
             except Exception as e:
-                print(f"❌ 从token.pickle加载令牌失败: {e}")
+                logger.error("❌ 从%s加载令牌失败: %s", LEGACY_TOKEN_FILE, e)
 
         # 方案2: 从环境变量加载令牌（生产环境）
         if not creds:
@@ -411,65 +826,81 @@ class GoogleCalendarManager:
                 try:
                     token_info = json.loads(token_json)
                     creds = Credentials.from_authorized_user_info(token_info, self.SCOPES)
-                    print("✅ 从环境变量加载令牌成功")
+                    logger.info("✅ 从环境变量加载令牌成功")
                 except Exception as e:
-                    print(f"❌ 从环境变量加载令牌失败: {e}")
+                    logger.error("❌ 从环境变量加载令牌失败: %s", e)
 
-        # 检查令牌有效性
-        if creds and creds.expired and creds.refresh_token:
+        # 检查令牌有效性 - 仍然有效且60秒内不会过期时跳过刷新
+        if creds and creds.refresh_token and self._token_needs_refresh(creds):
             try:
                 creds.refresh(Request())
-                print("✅ 令牌刷新成功")
+                logger.info("✅ 令牌刷新成功")
             except Exception as e:
-                print(f"❌ 令牌刷新失败: {e}")
+                logger.error("❌ 令牌刷新失败: %s", e)
                 creds = None
+            else:
+                # 本地开发时保存刷新后的令牌，下次启动无需再次刷新
+                if from_file:
+                    try:
+                        self._save_token(creds)
+                    except OSError as e:
+                        logger.warning("⚠️ 保存刷新后的令牌失败: %s", e)
 
         # 如果没有有效令牌，启动OAuth流程（使用本地credentials.json）
         if not creds:
-            print("🚀 启动本地OAuth授权流程...")
+            logger.info("🚀 启动本地OAuth授权流程...")
             try:
                 # 优先使用本地的credentials.json文件
                 if os.path.exists('credentials.json'):
                     flow = InstalledAppFlow.from_client_secrets_file(
                         'credentials.json', self.SCOPES)
                     creds = flow.run_local_server(port=0)
-                    print("✅ 使用credentials.json授权成功")
+                    logger.info("✅ 使用credentials.json授权成功")
                 else:
                     # 备选方案：从环境变量构建配置
                     credentials_info = self._get_credentials_from_env()
                     flow = InstalledAppFlow.from_client_config(
                         credentials_info, self.SCOPES)
                     creds = flow.run_local_server(port=0)
-                    print("✅ 使用环境变量配置授权成功")
+                    logger.info("✅ 使用环境变量配置授权成功")
 
                 # 保存令牌供后续使用
-                with open('token.pickle', 'wb') as token:
-                    pickle.dump(creds, token)
-                print("✅ OAuth授权成功，令牌已保存到token.pickle")
+                self._save_token(creds)
+                logger.info("✅ OAuth授权成功，令牌已保存到%s", TOKEN_FILE)
 
             except Exception as e:
-                print(f"❌ OAuth授权失败: {e}")
-                print("💡 请确保：")
-                print("   1. 在项目根目录放置credentials.json文件")
-                print("   2. 或者在.env文件中配置GOOGLE_CLIENT_ID和GOOGLE_CLIENT_SECRET")
+                logger.error("❌ OAuth授权失败: %s", e)
+                logger.error("💡 请确保：")
+                logger.error("   1. 在项目根目录放置credentials.json文件")
+                logger.error("   2. 或者在.env文件中配置GOOGLE_CLIENT_ID和GOOGLE_CLIENT_SECRET")
                 return None
 
-        return build('calendar', 'v3', credentials=creds)
+        # 日历和任务服务共用同一组按线程复用的HTTP连接
+        self._http_pool = _ThreadLocalAuthorizedHttp(creds)
+
+        # 使用随客户端库打包的离线发现文档，避免每次构建服务都联网下载并解析
+        return build('calendar', 'v3', credentials=creds, requestBuilder=self._http_pool.build_request,
+                     model=_GOOGLE_JSON_MODEL, static_discovery=True, cache_discovery=False)
+
+    @staticmethod
+    def _token_needs_refresh(creds, margin_seconds=60):
+        """令牌已失效，或将在margin_seconds秒内过期"""
+        if not creds.valid:
+            return True
+        if creds.expiry is None:
+            return False
+        # google-auth的expiry为不带时区的UTC时间
+        remaining = creds.expiry - datetime.now(timezone.utc).replace(tzinfo=None)
+        return remaining.total_seconds() < margin_seconds
+
+    def _save_token(self, creds):
+        """以JSON格式保存令牌"""
+        with open(TOKEN_FILE, 'w', encoding='utf-8') as token:
+            token.write(creds.to_json())
 
     def _get_credentials_from_env(self):
         """从环境变量构建credentials字典（备用方案）"""
-        credentials_info = {
-            "installed": {
-                "client_id": os.environ.get("GOOGLE_CLIENT_ID", ""),
-                "project_id": os.environ.get("GOOGLE_PROJECT_ID", ""),
-                "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                "token_uri": "https://oauth2.googleapis.com/token",
-                "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-                "client_secret": os.environ.get("GOOGLE_CLIENT_SECRET", ""),
-                "redirect_uris": [os.environ.get("GOOGLE_REDIRECT_URIS", "http://localhost")]
-            }
-        }
-        return credentials_info
+        return _google_client_config()
 
     # ========== 任务管理功能 ==========
 
@@ -481,50 +912,85 @@ class GoogleCalendarManager:
             task_lists = self.tasks_service.tasklists().list().execute()
             return task_lists.get('items', [])
         except HttpError as error:
-            print(f"❌ 获取任务列表失败: {error}")
+            logger.error("❌ 获取任务列表失败: %s", error)
             return []
 
     def get_or_create_default_task_list(self):
-        """获取或创建默认任务列表"""
+        """获取或创建默认任务列表（结果缓存在实例上，只查询一次）"""
         if not self.tasks_service:
             return None
+        if self._default_task_list_id:
+            return self._default_task_list_id
 
         task_lists = self.get_task_lists()
         if task_lists:
             # 返回第一个任务列表
-            return task_lists[0]['id']
+            self._default_task_list_id = task_lists[0]['id']
         else:
             # 创建新的任务列表
             try:
                 task_list = self.tasks_service.tasklists().insert(body={
                     'title': '智能助手任务'
                 }).execute()
-                return task_list['id']
+                self._default_task_list_id = task_list['id']
             except HttpError as error:
-                print(f"❌ 创建任务列表失败: {error}")
+                logger.error("❌ 创建任务列表失败: %s", error)
                 return None
+        return self._default_task_list_id
 
-    def create_task(self, title, notes="", due_date=None, reminder_minutes=60, priority="medium"):
+    def _run_batches(self, service, batch_requests, batch_size, label):
         """
-        创建Google任务
+        将(request_id, 请求)列表按batch_size分批，多个批次并发执行，返回成功的子请求数量
+
+        每个批次在执行它的线程上使用该线程自己的连接（httplib2.Http不是线程安全的）；
+        单个批次整体失败只记录日志，其余批次照常执行，返回值仍是实际成功的数量
         """
-        if not self.tasks_service:
-            return {
-                "success": False,
-                "error": "❌ 任务服务未初始化"
-            }
+        succeeded = []
 
-        try:
-            task_list_id = self.get_or_create_default_task_list()
-            if not task_list_id:
-                return {
-                    "success": False,
-                    "error": "❌ 无法获取任务列表"
-                }
+        def on_response(request_id, response, exception):
+            if exception is None:
+                succeeded.append(request_id)
+            else:
+                logger.error("❌ %s %s 失败: %s", label, request_id, exception)
 
-            # 优先级映射
-            priority_map = {"low": "1", "medium": "3", "high": "5"}
+        def execute_chunk(chunk):
+            batch = service.new_batch_http_request(callback=on_response)
+            for request_id, request in chunk:
+                batch.add(request, request_id=request_id)
+            try:
+                batch.execute(http=self._http_pool.get())
+            except Exception:
+                logger.exception("❌ %s 批量请求失败（%s 个子请求）", label, len(chunk))
 
+        chunks = [batch_requests[i:i + batch_size] for i in range(0, len(batch_requests), batch_size)]
+        if len(chunks) == 1:
+            execute_chunk(chunks[0])
+        else:
+            # list()等待所有批次完成
+            list(_GOOGLE_BATCH_EXECUTOR.map(execute_chunk, chunks))
+        return len(succeeded)
+
+    def _cached_query(self, key, fn, *args):
+        """执行查询并缓存成功的结果；命中缓存时不发起网络请求"""
+        cached = self._query_cache.get(key)
+        if cached is not None:
+            return cached
+        result = fn(*args)
+        if result.get("success"):
+            self._query_cache.set(key, result)
+        return result
+
+    def invalidate_task_list_cache(self):
+        """清除缓存的默认任务列表ID（任务列表被删除或更换后调用）"""
+        self._default_task_list_id = None
+        self._query_cache.clear()
+
+    @_with_task_list
+    def create_task(self, task_list_id, title, notes="", due_date=None, reminder_minutes=60, priority="medium"):
+        """
+        创建Google任务
+        """
+        try:
             task_body = {
                 'title': title,
                 'notes': notes,
@@ -535,17 +1001,18 @@ class GoogleCalendarManager:
             if due_date:
                 # 确保使用北京时区
                 if due_date.tzinfo is None:
-                    due_date = self.beijing_tz.localize(due_date)
+                    due_date = due_date.replace(tzinfo=self.beijing_tz)
                 # Google Tasks使用RFC 3339格式
                 task_body['due'] = due_date.isoformat()
 
             # 设置优先级
-            task_body['priority'] = priority_map.get(priority, "3")
+            task_body['priority'] = self._TASK_PRIORITY_TO_API.get(priority, "3")
 
             task = self.tasks_service.tasks().insert(
                 tasklist=task_list_id,
                 body=task_body
             ).execute()
+            self._query_cache.clear()
 
             return {
                 "success": True,
@@ -560,35 +1027,27 @@ class GoogleCalendarManager:
             }
 
     def query_tasks(self, show_completed=False, max_results=50):
+        """查询任务（结果短期缓存）"""
+        return self._cached_query(("tasks", show_completed, max_results),
+                                  self._query_tasks, show_completed, max_results)
+
+    @_with_task_list
+    def _query_tasks(self, task_list_id, show_completed, max_results):
         """
         查询任务
         """
-        if not self.tasks_service:
-            return {
-                "success": False,
-                "error": "❌ 任务服务未初始化"
-            }
-
         try:
-            task_list_id = self.get_or_create_default_task_list()
-            if not task_list_id:
-                return {
-                    "success": False,
-                    "error": "❌ 无法获取任务列表"
-                }
-
             # 构建查询参数
-            params = {
-                'tasklist': task_list_id,
-                'maxResults': max_results
-            }
-
+            params = {}
             if not show_completed:
                 params['showCompleted'] = False
                 params['showHidden'] = False
 
-            tasks_result = self.tasks_service.tasks().list(**params).execute()
-            tasks = tasks_result.get('items', [])
+            # 单页最多100条，超出部分按nextPageToken翻页获取
+            tasks = list(itertools.islice(
+                self._iter_tasks(task_list_id, page_size=min(max_results, 100), **params),
+                max_results
+            ))
 
             if not tasks:
                 return {
@@ -602,15 +1061,14 @@ class GoogleCalendarManager:
                 # 处理截止日期
                 due_date = task.get('due')
                 if due_date:
-                    due_dt = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
-                    due_beijing = due_dt.astimezone(self.beijing_tz)
-                    due_display = due_beijing.strftime('%Y-%m-%d %H:%M')
+                    # Python 3.11+ 的fromisoformat可直接解析末尾的Z
+                    d = datetime.fromisoformat(due_date).astimezone(self.beijing_tz)
+                    due_display = f"{d.year:04d}-{d.month:02d}-{d.day:02d} {d.hour:02d}:{d.minute:02d}"
                 else:
                     due_display = "无截止日期"
 
                 # 处理优先级
-                priority_map = {"1": "low", "3": "medium", "5": "high"}
-                priority = priority_map.get(task.get('priority', '3'), 'medium')
+                priority = self._TASK_PRIORITY_FROM_API.get(task.get('priority', '3'), 'medium')
 
                 # 处理状态
                 status = "completed" if task.get('status') == 'completed' else "needsAction"
@@ -638,43 +1096,35 @@ class GoogleCalendarManager:
                 "error": f"❌ 查询任务失败: {error}"
             }
 
-    def update_task_status(self, task_id, status="completed"):
+    def _iter_tasks(self, task_list_id, page_size=100, **params):
+        """逐页遍历任务列表中的任务（自动跟随nextPageToken，按需获取下一页）"""
+        request = self.tasks_service.tasks().list(tasklist=task_list_id, maxResults=page_size, **params)
+        while request is not None:
+            response = request.execute()
+            yield from response.get('items', [])
+            request = self.tasks_service.tasks().list_next(request, response)
+
+    @_with_task_list
+    def update_task_status(self, task_list_id, task_id, status="completed"):
         """
         更新任务状态
         """
-        if not self.tasks_service:
-            return {
-                "success": False,
-                "error": "❌ 任务服务未初始化"
-            }
-
         try:
-            task_list_id = self.get_or_create_default_task_list()
-            if not task_list_id:
-                return {
-                    "success": False,
-                    "error": "❌ 无法获取任务列表"
-                }
-
-            # 先获取任务
-            task = self.tasks_service.tasks().get(
-                tasklist=task_list_id,
-                task=task_id
-            ).execute()
-
-            # 更新状态
+            # 使用patch只提交状态字段，无需先获取整个任务
             if status == "completed":
-                task['status'] = 'completed'
-                task['completed'] = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+                body = {
+                    'status': 'completed',
+                    'completed': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+                }
             else:
-                task['status'] = 'needsAction'
-                task.pop('completed', None)  # 移除完成时间
+                body = {'status': 'needsAction', 'completed': None}  # 清除完成时间
 
-            updated_task = self.tasks_service.tasks().update(
+            self.tasks_service.tasks().patch(
                 tasklist=task_list_id,
                 task=task_id,
-                body=task
+                body=body
             ).execute()
+            self._query_cache.clear()
 
             status_text = "完成" if status == "completed" else "重新打开"
             return {
@@ -688,26 +1138,11 @@ class GoogleCalendarManager:
                 "error": f"❌ 更新任务状态失败: {error}"
             }
 
-    def delete_task(self, task_id):
+    @_with_task_list
+    def delete_task(self, task_list_id, task_id):
         """删除任务"""
-        if not self.tasks_service:
-            return {
-                "success": False,
-                "error": "❌ 任务服务未初始化"
-            }
-
         try:
-            task_list_id = self.get_or_create_default_task_list()
-            if not task_list_id:
-                return {
-                    "success": False,
-                    "error": "❌ 无法获取任务列表"
-                }
-
-            self.tasks_service.tasks().delete(
-                tasklist=task_list_id,
-                task=task_id
-            ).execute()
+            self._delete_task(task_list_id, task_id)
 
             return {
                 "success": True,
@@ -720,7 +1155,25 @@ class GoogleCalendarManager:
                 "error": f"❌ 删除任务失败: {error}"
             }
 
-    def delete_task_by_title(self, title_keyword, show_completed=True):
+    def _delete_task(self, task_list_id, task_id):
+        """删除指定任务列表中的单个任务"""
+        self.tasks_service.tasks().delete(tasklist=task_list_id, task=task_id).execute()
+        self._query_cache.clear()
+
+    def _batch_delete_tasks(self, task_list_id, task_ids):
+        """通过批量请求删除指定任务列表中的多个任务（每批最多100个），返回成功删除的数量"""
+        delete_requests = [
+            (task_id, self.tasks_service.tasks().delete(tasklist=task_list_id, task=task_id))
+            for task_id in task_ids
+        ]
+        try:
+            return self._run_batches(self.tasks_service, delete_requests, _TASKS_BATCH_SIZE, "删除任务")
+        finally:
+            # 即使中途出错，已执行的批次也可能删除了任务，缓存必须失效
+            self._query_cache.clear()
+
+    @_with_task_list
+    def delete_task_by_title(self, task_list_id, title_keyword, show_completed=True):
         """根据标题关键词删除任务"""
         try:
             result = self.query_tasks(show_completed=show_completed, max_results=100)
@@ -738,12 +1191,8 @@ class GoogleCalendarManager:
                     "error": f"❌ 未找到包含 '{title_keyword}' 的任务"
                 }
 
-            # 删除匹配的任务
-            deleted_count = 0
-            for task in matching_tasks:
-                delete_result = self.delete_task(task['id'])
-                if delete_result["success"]:
-                    deleted_count += 1
+            # 批量删除匹配的任务
+            deleted_count = self._batch_delete_tasks(task_list_id, [task['id'] for task in matching_tasks])
 
             return {
                 "success": True,
@@ -757,7 +1206,8 @@ class GoogleCalendarManager:
                 "error": f"❌ 删除任务时出错: {str(e)}"
             }
 
-    def delete_tasks_by_time_range(self, start_date=None, end_date=None, show_completed=True):
+    @_with_task_list
+    def delete_tasks_by_time_range(self, task_list_id, start_date=None, end_date=None, show_completed=True):
         """
         根据时间范围批量删除任务
 
@@ -766,18 +1216,12 @@ class GoogleCalendarManager:
             end_date: 结束日期 (datetime对象或字符串 "YYYY-MM-DD")
             show_completed: 是否包含已完成的任务
         """
-        if not self.tasks_service:
-            return {
-                "success": False,
-                "error": "❌ 任务服务未初始化"
-            }
-
         try:
             # 解析日期参数
             if isinstance(start_date, str):
-                start_date = datetime.strptime(start_date, "%Y-%m-%d")
+                start_date = _parse_dt(start_date, "%Y-%m-%d")
             if isinstance(end_date, str):
-                end_date = datetime.strptime(end_date, "%Y-%m-%d")
+                end_date = _parse_dt(end_date, "%Y-%m-%d")
 
             # 如果没有指定结束日期，默认为开始日期后30天
             if start_date and not end_date:
@@ -793,30 +1237,19 @@ class GoogleCalendarManager:
 
             # 确保使用北京时区
             if start_date.tzinfo is None:
-                start_date = self.beijing_tz.localize(start_date)
+                start_date = start_date.replace(tzinfo=self.beijing_tz)
             if end_date.tzinfo is None:
-                end_date = self.beijing_tz.localize(end_date)
-
-            # 获取所有任务
-            result = self.query_tasks(show_completed=show_completed, max_results=500)
-            if not result["success"]:
-                return result
-
-            matching_tasks = []
-            for task in result["tasks"]:
-                # 检查任务是否有截止日期
-                if task['due'] != "无截止日期":
-                    try:
-                        # 解析任务的截止日期
-                        task_due = datetime.strptime(task['due'], '%Y-%m-%d %H:%M')
-                        task_due = self.beijing_tz.localize(task_due)
+                end_date = end_date.replace(tzinfo=self.beijing_tz)
 
-                        # 检查任务是否在时间范围内
-                        if start_date <= task_due <= end_date:
-                            matching_tasks.append(task)
-                    except ValueError:
-                        # 如果日期解析失败，跳过这个任务
-                        continue
+            # 由服务端按截止时间过滤，只返回范围内的任务
+            params = {
+                'dueMin': start_date.isoformat(),
+                'dueMax': end_date.isoformat()
+            }
+            if not show_completed:
+                params['showCompleted'] = False
+                params['showHidden'] = False
+            matching_tasks = list(self._iter_tasks(task_list_id, **params))
 
             if not matching_tasks:
                 start_str = start_date.strftime('%Y-%m-%d')
@@ -826,12 +1259,8 @@ class GoogleCalendarManager:
                     "error": f"❌ 在 {start_str} 到 {end_str} 范围内没有找到任务"
                 }
 
-            # 删除匹配的任务
-            deleted_count = 0
-            for task in matching_tasks:
-                delete_result = self.delete_task(task['id'])
-                if delete_result["success"]:
-                    deleted_count += 1
+            # 批量删除匹配的任务
+            deleted_count = self._batch_delete_tasks(task_list_id, [task['id'] for task in matching_tasks])
 
             start_str = start_date.strftime('%Y-%m-%d')
             end_str = end_date.strftime('%Y-%m-%d')
@@ -855,10 +1284,7 @@ class GoogleCalendarManager:
         创建日历事件 - 修复时区问题
         """
         if not self.service:
-            return {
-                "success": False,
-                "error": "❌ 日历服务未初始化"
-            }
+            return _ERR_NO_CALENDAR_SERVICE
 
         # 确保使用北京时间
         if not start_time:
@@ -868,12 +1294,9 @@ class GoogleCalendarManager:
 
         # 如果传入的是naive datetime，转换为北京时区
         if start_time.tzinfo is None:
-            start_time = self.beijing_tz.localize(start_time)
+            start_time = start_time.replace(tzinfo=self.beijing_tz)
         if end_time.tzinfo is None:
-            end_time = self.beijing_tz.localize(end_time)
-
-        # 优先级映射
-        priority_map = {"low": "5", "medium": "3", "high": "1"}
+            end_time = end_time.replace(tzinfo=self.beijing_tz)
 
         event = {
             'summary': summary,
@@ -902,6 +1325,7 @@ class GoogleCalendarManager:
 
         try:
             event = self.service.events().insert(calendarId='primary', body=event).execute()
+            self._query_cache.clear()
             return {
                 "success": True,
                 "event_id": event['id'],
@@ -915,14 +1339,15 @@ class GoogleCalendarManager:
             }
 
     def query_events(self, days=30, max_results=50):
+        """查询日历事件（结果短期缓存）"""
+        return self._cached_query(("events", days, max_results), self._query_events, days, max_results)
+
+    def _query_events(self, days, max_results):
         """
         查询未来一段时间内的日历事件 - 修复时区问题
         """
         if not self.service:
-            return {
-                "success": False,
-                "error": "❌ 日历服务未初始化"
-            }
+            return _ERR_NO_CALENDAR_SERVICE
 
         # 使用北京时区的时间范围
         now_beijing = datetime.now(self.beijing_tz)
@@ -939,7 +1364,9 @@ class GoogleCalendarManager:
                 timeMax=future_rfc3339,
                 maxResults=max_results,
                 singleEvents=True,
-                orderBy='startTime'
+                orderBy='startTime',
+                # 只取用到的字段，减少传输和解析的数据量
+                fields=_EVENT_LIST_FIELDS
             ).execute()
 
             events = events_result.get('items', [])
@@ -951,28 +1378,7 @@ class GoogleCalendarManager:
                     "message": f"📭 未来{days}天内没有日历事件"
                 }
 
-            formatted_events = []
-            for event in events:
-                start = event['start'].get('dateTime', event['start'].get('date'))
-                end = event['end'].get('dateTime', event['end'].get('date'))
-                priority = event.get('extendedProperties', {}).get('private', {}).get('priority', 'medium')
-                status = event.get('extendedProperties', {}).get('private', {}).get('status', 'confirmed')
-
-                # 转换时间为北京时间显示
-                if 'T' in start:  # 这是日期时间，不是全天事件
-                    start_dt = datetime.fromisoformat(start.replace('Z', '+00:00'))
-                    start_beijing = start_dt.astimezone(self.beijing_tz)
-                    start = start_beijing.strftime('%Y-%m-%d %H:%M:%S')
-
-                formatted_events.append({
-                    'id': event['id'],
-                    'summary': event.get('summary', '无标题'),
-                    'description': event.get('description', ''),
-                    'start': start,
-                    'end': end,
-                    'priority': priority,
-                    'status': status
-                })
+            formatted_events = [self._format_event(event) for event in events]
 
             return {
                 "success": True,
@@ -987,6 +1393,28 @@ class GoogleCalendarManager:
                 "error": f"❌ 查询日历事件失败: {error}"
             }
 
+    def _format_event(self, event):
+        """将API返回的事件转换为简化结构（开始时间转为北京时间显示）"""
+        start = event['start'].get('dateTime', event['start'].get('date'))
+        end = event['end'].get('dateTime', event['end'].get('date'))
+        ext = event.get('extendedProperties')
+        private = (ext.get('private') if ext else None) or _EMPTY_MAPPING
+
+        # 转换时间为北京时间显示
+        if 'T' in start:  # 这是日期时间，不是全天事件
+            d = datetime.fromisoformat(start).astimezone(self.beijing_tz)
+            start = f"{d.year:04d}-{d.month:02d}-{d.day:02d} {d.hour:02d}:{d.minute:02d}:{d.second:02d}"
+
+        return {
+            'id': event['id'],
+            'summary': event.get('summary', '无标题'),
+            'description': event.get('description', ''),
+            'start': start,
+            'end': end,
+            'priority': private.get('priority', 'medium'),
+            'status': private.get('status', 'confirmed')
+        }
+
     def get_current_time_info(self):
         """获取当前时间信息 - 用于调试时区问题"""
         utc_now = datetime.now(timezone.utc)
@@ -1003,29 +1431,21 @@ class GoogleCalendarManager:
     def update_event_status(self, event_id, status="completed"):
         """更新事件状态"""
         if not self.service:
-            return {
-                "success": False,
-                "error": "❌ 日历服务未初始化"
-            }
+            return _ERR_NO_CALENDAR_SERVICE
 
         try:
-            # 先获取事件
-            event = self.service.events().get(calendarId='primary', eventId=event_id).execute()
-
-            # 更新状态
-            if 'extendedProperties' not in event:
-                event['extendedProperties'] = {'private': {}}
-            elif 'private' not in event['extendedProperties']:
-                event['extendedProperties']['private'] = {}
-
-            event['extendedProperties']['private']['status'] = status
+            # 使用patch只提交变更的字段（扩展属性会与已有值合并）
+            body = {'extendedProperties': {'private': {'status': status}}}
 
-            # 如果是完成状态，可以添加完成标记
+            # 如果是完成状态，可以添加完成标记 - 只需额外读取标题
             if status == "completed":
-                event['summary'] = "✅ " + event.get('summary', '')
+                event = self.service.events().get(
+                    calendarId='primary', eventId=event_id, fields='summary').execute()
+                body['summary'] = "✅ " + event.get('summary', '')
 
-            updated_event = self.service.events().update(
-                calendarId='primary', eventId=event_id, body=event).execute()
+            self.service.events().patch(
+                calendarId='primary', eventId=event_id, body=body).execute()
+            self._query_cache.clear()
 
             return {
                 "success": True,
@@ -1041,13 +1461,11 @@ class GoogleCalendarManager:
     def delete_event(self, event_id):
         """删除日历事件"""
         if not self.service:
-            return {
-                "success": False,
-                "error": "❌ 日历服务未初始化"
-            }
+            return _ERR_NO_CALENDAR_SERVICE
 
         try:
             self.service.events().delete(calendarId='primary', eventId=event_id).execute()
+            self._query_cache.clear()
             return {
                 "success": True,
                 "message": "🗑️ 日历事件已成功删除"
@@ -1058,18 +1476,32 @@ class GoogleCalendarManager:
                 "error": f"❌ 删除日历事件失败: {error}"
             }
 
+    def _batch_delete_events(self, event_ids):
+        """通过批量请求删除多个日历事件（每批最多50个），返回成功删除的数量"""
+        delete_requests = [
+            (event_id, self.service.events().delete(calendarId='primary', eventId=event_id))
+            for event_id in event_ids
+        ]
+        try:
+            return self._run_batches(self.service, delete_requests, _CALENDAR_BATCH_SIZE, "删除事件")
+        finally:
+            # 即使中途出错，已执行的批次也可能删除了事件，缓存必须失效
+            self._query_cache.clear()
+
     def delete_event_by_summary(self, summary, days=30):
         """根据事件标题删除事件（支持模糊匹配）"""
+        if not self.service:
+            return _ERR_NO_CALENDAR_SERVICE
+
         try:
-            # 先查询匹配的事件
+            keyword = summary.lower()
+
+            # 服务端q=按词搜索，中文子串可能只命中一部分；直接在（缓存的）事件列表中按子串匹配
             result = self.query_events(days=days, max_results=100)
             if not result["success"]:
                 return result
-
-            matching_events = []
-            for event in result["events"]:
-                if summary.lower() in event['summary'].lower():
-                    matching_events.append(event)
+            matching_events = [event for event in result["events"]
+                               if keyword in event['summary'].lower()]
 
             if not matching_events:
                 return {
@@ -1077,12 +1509,8 @@ class GoogleCalendarManager:
                     "error": f"❌ 未找到包含 '{summary}' 的事件"
                 }
 
-            # 删除匹配的事件
-            deleted_count = 0
-            for event in matching_events:
-                delete_result = self.delete_event(event['id'])
-                if delete_result["success"]:
-                    deleted_count += 1
+            # 批量删除匹配的事件 - 一次HTTP往返完成
+            deleted_count = self._batch_delete_events([event['id'] for event in matching_events])
 
             return {
                 "success": True,
@@ -1105,17 +1533,14 @@ class GoogleCalendarManager:
             end_date: 结束日期 (datetime对象或字符串 "YYYY-MM-DD")
         """
         if not self.service:
-            return {
-                "success": False,
-                "error": "❌ 日历服务未初始化"
-            }
+            return _ERR_NO_CALENDAR_SERVICE
 
         try:
             # 解析日期参数
             if isinstance(start_date, str):
-                start_date = datetime.strptime(start_date, "%Y-%m-%d")
+                start_date = _parse_dt(start_date, "%Y-%m-%d")
             if isinstance(end_date, str):
-                end_date = datetime.strptime(end_date, "%Y-%m-%d")
+                end_date = _parse_dt(end_date, "%Y-%m-%d")
 
             # 如果没有指定结束日期，默认为开始日期后30天
             if start_date and not end_date:
@@ -1131,9 +1556,9 @@ class GoogleCalendarManager:
 
             # 确保使用北京时区
             if start_date.tzinfo is None:
-                start_date = self.beijing_tz.localize(start_date)
+                start_date = start_date.replace(tzinfo=self.beijing_tz)
             if end_date.tzinfo is None:
-                end_date = self.beijing_tz.localize(end_date)
+                end_date = end_date.replace(tzinfo=self.beijing_tz)
 
             # 转换为RFC3339格式
             start_rfc3339 = start_date.isoformat()
@@ -1159,18 +1584,8 @@ class GoogleCalendarManager:
                     "error": f"❌ 在 {start_str} 到 {end_str} 范围内没有找到日历事件"
                 }
 
-            # 删除匹配的事件
-            deleted_count = 0
-            for event in events:
-                try:
-                    self.service.events().delete(
-                        calendarId='primary',
-                        eventId=event['id']
-                    ).execute()
-                    deleted_count += 1
-                except HttpError as error:
-                    print(f"❌ 删除事件 {event['id']} 失败: {error}")
-                    continue
+            # 批量删除匹配的事件
+            deleted_count = self._batch_delete_events([event['id'] for event in events])
 
             start_str = start_date.strftime('%Y-%m-%d')
             end_str = end_date.strftime('%Y-%m-%d')
@@ -1190,21 +1605,9 @@ class GoogleCalendarManager:
 class DeepseekAgent:
     """智能助手Agent - 集成股票分析功能"""
 
-    def __init__(self):
-        self.client = OpenAI(
-            base_url="https://ark.cn-beijing.volces.com/api/v3/bots",
-            api_key=os.environ.get("ARK_API_KEY")
-        )
-        self.model_id = "bot-20250907084333-cbvff"
-
-        # 初始化Google日历管理器
-        self.calendar_manager = GoogleCalendarManager()
-
-        # 初始化股票分析代理
-        self.stock_agent = StockAnalysisPDFAgent()
-
-        # 更新系统提示词 - 添加股票分析功能
-        self.system_prompt = """你是一个智能助手，具备工具调用能力。当用户请求涉及日历、任务、天气、计算、邮件或股票分析时，你需要返回JSON格式的工具调用。
+    # 系统提示词 - 添加股票分析功能（类级常量，所有实例共享）
+    # 注意：提示词需保持逐字节不变（不要拼接日期等动态内容），服务端前缀缓存才能命中
+    system_prompt = """你是一个智能助手，具备工具调用能力。当用户请求涉及日历、任务、天气、计算、邮件或股票分析时，你需要返回JSON格式的工具调用。
 
 可用工具：
 【日历事件功能】
@@ -1231,13 +1634,15 @@ class DeepseekAgent:
 15. 计算器：{"action": "calculator", "parameters": {"expression": "数学表达式"}}
 16. 发送邮件：{"action": "send_email", "parameters": {"to": "收件邮箱", "subject": "邮件主题", "body": "邮件内容"}}
 
+【综合查询】
+17. 同时查询日历事件和待办任务（如"看看我这周的安排"）：{"action": "query_all", "parameters": {"days": 7, "max_results": 20}}
+
 重要规则：
 1. 当需要调用工具时，必须返回 ```json 和 ``` 包裹的JSON格式
 2. 不需要工具时，直接用自然语言回答
 3. JSON格式必须严格符合上面的示例
 4. 时间格式：YYYY-MM-DD HH:MM (24小时制)，日期格式：YYYY-MM-DD
 5. 优先级：low(低), medium(中), high(高)
-6. 股票分析功能会返回PDF二进制数据，用于后续上传或其他操作
 
 示例：
 用户：生成腾讯控股的股票分析报告
@@ -1248,29 +1653,88 @@ AI：```json
 AI：```json
 {"action": "delete_tasks_by_time_range", "parameters": {"start_date": "2025-10-01", "end_date": "2025-10-31"}}
 ```
-用户：清理下周的所有日历事件
-AI：```json
-{"action": "delete_events_by_time_range", "parameters": {"start_date": "2025-10-06", "end_date": "2025-10-12"}}
-```
 用户：今天天气怎么样
 AI：```json
 {"action": "get_weather", "parameters": {"city": "北京"}}
 ```
 """
 
+    # 系统消息只构建一次，每轮对话直接复用
+    _system_message = {"role": "system", "content": system_prompt}
+
+    # 任务列表中优先级对应的图标
+    _PRIORITY_EMOJI = {"low": "⚪", "medium": "🟡", "high": "🔴"}
+
+    # 工具规格：action -> (方法名, 参数默认值)
+    _TOOL_SPECS = {
+        "create_task": ("create_task", {
+            "title": "", "notes": "", "due_date": None, "reminder_minutes": 60, "priority": "medium"
+        }),
+        "query_tasks": ("query_tasks", {"show_completed": False, "max_results": 20}),
+        "update_task_status": ("update_task_status", {"task_id": "", "status": "completed"}),
+        "delete_task": ("delete_task", {"task_id": ""}),
+        "delete_task_by_title": ("delete_task_by_title", {"title_keyword": ""}),
+        "delete_tasks_by_time_range": ("delete_tasks_by_time_range", {
+            "start_date": None, "end_date": None, "show_completed": True
+        }),
+        "create_event": ("create_event", {
+            "summary": "", "description": "", "start_time": None, "end_time": None,
+            "reminder_minutes": 30, "priority": "medium"
+        }),
+        "query_events": ("query_events", {"days": 30, "max_results": 20}),
+        "query_all": ("query_all", {"days": 7, "max_results": 20}),
+        "update_event_status": ("update_event_status", {"event_id": "", "status": "completed"}),
+        "delete_event": ("delete_event", {"event_id": ""}),
+        "delete_event_by_summary": ("delete_event_by_summary", {"summary": "", "days": 30}),
+        "delete_events_by_time_range": ("delete_events_by_time_range", {"start_date": None, "end_date": None}),
+        "generate_stock_report": ("stock_report_tool", {"stock_name": ""}),
+        "get_weather": ("get_weather", {"city": ""}),
+        "calculator": ("calculator", {"expression": ""}),
+        "send_email": ("send_email", {"to": "", "subject": "", "body": ""}),
+    }
+
+    def __init__(self, client=None):
+        self.client = client or get_ark_client()
+        self.model_id = "bot-20250907084333-cbvff"
+
+        # 初始化Google日历管理器
+        self.calendar_manager = GoogleCalendarManager()
+
+        # 初始化股票分析代理
+        self.stock_agent = StockAnalysisPDFAgent(client=self.client)
+
+        # 工具分发表：action -> (绑定方法, 参数默认值, 是否为协程函数)，只在构造时解析一次
+        self._tools = {}
+        for action, (method_name, defaults) in self._TOOL_SPECS.items():
+            handler = getattr(self, method_name)
+            self._tools[action] = (handler, defaults, inspect.iscoroutinefunction(handler))
+
     def get_weather(self, city):
-        """获取天气信息"""
+        """获取天气信息（按城市缓存10分钟）"""
         if not city:
             return "请指定城市名称"
 
+        key = city.strip().lower()
+        cached = _WEATHER_CACHE.get(key)
+        if cached is not None:
+            return cached
+
+        # 多个用户同时查询同一城市时只请求一次上游
+        return _WEATHER_FLIGHT.do(key, self._fetch_weather, city, key)
+
+    def _fetch_weather(self, city, key):
+        """请求wttr.in并写入天气缓存"""
         try:
-            response = requests.get(f"https://wttr.in/{city}?format=j1", timeout=10)
+            response = _HTTP_SESSION.get(f"https://wttr.in/{city}?format=j1", timeout=(3.05, 10))
             weather_data = response.json()
             current = weather_data["current_condition"][0]
-            return (f"{city}天气：{current['weatherDesc'][0]['value']}，"
-                    f"温度{current['temp_C']}°C，湿度{current['humidity']}%")
+            result = (f"{city}天气：{current['weatherDesc'][0]['value']}，"
+                      f"温度{current['temp_C']}°C，湿度{current['humidity']}%")
+            _WEATHER_CACHE.set(key, result)
+            return result
         except:
-            return "天气查询失败"
+            # 查询失败时退回到最近一次的结果
+            return _WEATHER_CACHE.get(key, allow_stale=True) or "天气查询失败"
 
     def calculator(self, expression):
         """执行数学计算"""
@@ -1278,64 +1742,70 @@ AI：```json
             return "请提供数学表达式"
 
         try:
-            allowed_chars = {'+', '-', '*', '/', '(', ')', '.', ' ', '0', '1', '2', '3', '4', '5', '6', '7', '8',
-                             '9'}
-            if not all(c in allowed_chars for c in expression):
+            if not _CALC_ALLOWED_CHARS.issuperset(expression):
                 return "表达式包含不支持的字符"
-            result = eval(expression)
+            result = _evaluate_expression(expression)
             return f"{expression} = {result}"
         except:
             return "计算失败"
 
     def send_email(self, to, subject, body):
-        """发送邮件 - 使用 Brevo API"""
+        """发送邮件 - 提交到后台线程池，立即返回排队回执"""
+        to, subject, body = (str(value or "").strip() for value in (to, subject, body))
         if not all([to, subject, body]):
             return "收件人、主题或正文不能为空"
 
-        brevo_api_key = os.environ.get("BREVO_API_KEY")
-        sender_email = os.environ.get("BREVO_SENDER_EMAIL")
-        sender_name = os.environ.get("BREVO_SENDER_NAME", "智能助手")
+        if not _EMAIL_RE.match(to):
+            return "❌ 邮件发送失败：收件人地址格式错误"
 
-        if not brevo_api_key:
+        if not BREVO_API_KEY:
             return "邮件服务未配置"
 
+        future = _MAIL_EXECUTOR.submit(self._send_email_sync, to, subject, body)
+        future.add_done_callback(lambda f: logger.info("📧 邮件发送结果: %s", f.result()))
+        return f"📧 邮件已排队发送至：{to}"
+
+    def _send_email_sync(self, to, subject, body):
+        """发送邮件 - 使用 Brevo API（在邮件线程池中执行）"""
         try:
-            url = "https://api.brevo.com/v3/smtp/email"
+            # 主题和正文来自用户输入，转义后再填入HTML模板，防止注入
+            html_content = _BREVO_HTML_TMPL.substitute(
+                subject=html.escape(subject),
+                body=html.escape(body)
+            )
 
             payload = {
                 "sender": {
-                    "name": sender_name,
-                    "email": sender_email
+                    "name": BREVO_SENDER_NAME,
+                    "email": BREVO_SENDER_EMAIL
                 },
                 "to": [{"email": to}],
                 "subject": subject,
-                "htmlContent": f"""
-                <div style="font-family: Arial, sans-serif; line-height: 1.6;">
-                    <h2>{subject}</h2>
-                    <div style="white-space: pre-line; padding: 20px; background: #f9f9f9; border-radius: 5px;">
-                        {body}
-                    </div>
-                    <p style="color: #999; font-size: 12px; margin-top: 20px;">
-                        此邮件由智能助手自动发送
-                    </p>
-                </div>
-                """,
+                "htmlContent": html_content,
                 "textContent": body
             }
 
-            headers = {
-                "accept": "application/json",
-                "content-type": "application/json",
-                "api-key": brevo_api_key
-            }
-
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
+            # orjson直接产出UTF-8字节，content-type已在_BREVO_HEADERS中声明
+            response = _HTTP_SESSION.post(
+                BREVO_API_URL,
+                data=orjson.dumps(payload),
+                headers=_BREVO_HEADERS,
+                timeout=(3.05, 30)
+            )
 
             if response.status_code == 201:
                 return f"📧 邮件发送成功！已发送至：{to}"
-            else:
-                error_data = response.json()
-                return f"❌ 邮件发送失败：{error_data.get('message', 'Unknown error')}"
+
+            # 错误响应体不一定是JSON（网关错误页、空响应），只在声明为JSON时解析
+            error_msg = None
+            if response.headers.get("content-type", "").startswith("application/json"):
+                try:
+                    error_msg = orjson.loads(response.content).get("message")
+                except (orjson.JSONDecodeError, AttributeError):
+                    pass
+            if not error_msg:
+                error_msg = response.text[:200] or f"HTTP {response.status_code}"
+            return f"❌ 邮件发送失败：{error_msg}"
 
         except Exception as e:
             return f"❌ 邮件发送异常：{str(e)}"
@@ -1352,35 +1822,56 @@ AI：```json
         返回:
         - PDF二进制数据，如果失败则返回None
         """
-        print(f"📈 开始生成股票分析报告: {stock_name}")
+        logger.debug("📈 开始生成股票分析报告: %s", stock_name)
 
         try:
             pdf_binary = await self.stock_agent.generate_stock_report(stock_name)
             if pdf_binary:
-                print(f"✅ 股票分析报告生成成功，大小: {len(pdf_binary)} 字节")
+                logger.info("✅ 股票分析报告生成成功，大小: %s 字节", len(pdf_binary))
                 # 返回PDF二进制数据，用于后续上传或其他操作
                 return pdf_binary
             else:
-                print("❌ 股票分析报告生成失败")
+                logger.error("❌ 股票分析报告生成失败")
                 return None
 
         except Exception as e:
-            print(f"❌ 生成股票分析报告时出错: {e}")
+            logger.error("❌ 生成股票分析报告时出错: %s", e)
             return None
 
+    async def stock_report_tool(self, stock_name=""):
+        """股票分析工具 - 返回包含PDF二进制数据的结果字典"""
+        pdf_binary = await self.generate_stock_report(stock_name)
+        if pdf_binary:
+            return {
+                "success": True,
+                "pdf_binary": pdf_binary,
+                "message": f"✅ 股票分析报告生成成功，PDF大小: {len(pdf_binary)} 字节",
+                "stock_name": stock_name
+            }
+        else:
+            return {
+                "success": False,
+                "error": "❌ 股票分析报告生成失败"
+            }
+
     # ========== Google日历和任务相关方法 ==========
 
+    @staticmethod
+    def _reply(result, default):
+        """从日历管理器的返回结果中提取回复文本"""
+        return result.get("message") or result.get("error") or default
+
     def create_task(self, title, notes="", due_date=None, reminder_minutes=60, priority="medium"):
         """创建Google任务"""
         try:
-            print(f"📝 开始创建任务: {title}")
+            logger.debug("📝 开始创建任务: %s", title)
 
             # 解析时间字符串
             due_dt = None
             if due_date:
-                print(f"⏰ 解析截止时间: {due_date}")
-                due_dt = datetime.strptime(due_date, "%Y-%m-%d %H:%M")
-                print(f"✅ 时间解析成功: {due_dt}")
+                logger.debug("⏰ 解析截止时间: %s", due_date)
+                due_dt = _parse_dt(due_date)
+                logger.debug("✅ 时间解析成功: %s", due_dt)
 
             result = self.calendar_manager.create_task(
                 title=title,
@@ -1391,22 +1882,22 @@ AI：```json
             )
 
             if result.get("success"):
-                print(f"✅ 任务创建成功: {title}")
+                logger.info("✅ 任务创建成功: %s", title)
                 return result.get("message", f"✅ 任务 '{title}' 创建成功")
             else:
                 error_msg = result.get("error", "创建任务失败")
-                print(f"❌ 任务创建失败: {error_msg}")
+                logger.error("❌ 任务创建失败: %s", error_msg)
                 return f"❌ {error_msg}"
 
         except Exception as e:
             error_msg = f"❌ 创建任务时出错: {str(e)}"
-            print(error_msg)
+            logger.error(error_msg)
             return error_msg
 
     def query_tasks(self, show_completed=False, max_results=20):
         """查询任务"""
         try:
-            print(f"🔍 查询任务: show_completed={show_completed}")
+            logger.debug("🔍 查询任务: show_completed=%s", show_completed)
 
             result = self.calendar_manager.query_tasks(
                 show_completed=show_completed,
@@ -1415,64 +1906,61 @@ AI：```json
 
             if not result["success"]:
                 error_msg = result.get("error", "查询任务失败")
-                print(f"❌ 查询失败: {error_msg}")
+                logger.error("❌ 查询失败: %s", error_msg)
                 return f"❌ {error_msg}"
 
             if not result["tasks"]:
-                print("📭 没有找到任务")
+                logger.debug("📭 没有找到任务")
                 return result["message"]
 
             # 格式化输出任务列表
             status_text = "所有" if show_completed else "待办"
-            tasks_text = f"📋 {status_text}任务列表 ({result['count']}个):\n\n"
+            parts = [f"📋 {status_text}任务列表 ({result['count']}个):\n\n"]
 
             for i, task in enumerate(result["tasks"], 1):
                 status_emoji = "✅" if task['status'] == "completed" else "⏳"
-                priority_emoji = {"low": "⚪", "medium": "🟡", "high": "🔴"}.get(task['priority'], '🟡')
+                priority_emoji = self._PRIORITY_EMOJI.get(task['priority'], '🟡')
 
-                tasks_text += f"{i}. {status_emoji}{priority_emoji} {task['title']}\n"
-                tasks_text += f"   截止: {task['due']}\n"
+                parts.append(f"{i}. {status_emoji}{priority_emoji} {task['title']}\n")
+                parts.append(f"   截止: {task['due']}\n")
                 if task['notes']:
-                    tasks_text += f"   描述: {task['notes'][:50]}...\n"
-                tasks_text += f"   状态: {task['status']} | 优先级: {task['priority']}\n"
-                tasks_text += f"   ID: {task['id'][:8]}...\n\n"
+                    parts.append(f"   描述: {task['notes'][:50]}...\n")
+                parts.append(f"   状态: {task['status']} | 优先级: {task['priority']}\n")
+                parts.append(f"   ID: {task['id'][:8]}...\n\n")
 
-            print(f"✅ 找到 {len(result['tasks'])} 个任务")
-            return tasks_text
+            logger.info("✅ 找到 %s 个任务", len(result["tasks"]))
+            return "".join(parts)
 
         except Exception as e:
             error_msg = f"❌ 查询任务时出错: {str(e)}"
-            print(error_msg)
+            logger.error(error_msg)
             return error_msg
 
     def update_task_status(self, task_id, status="completed"):
         """更新任务状态"""
         try:
-            result = self.calendar_manager.update_task_status(task_id, status)
-            return result.get("message", result.get("error", "状态更新完成"))
+            return self._reply(self.calendar_manager.update_task_status(task_id, status), "状态更新完成")
         except Exception as e:
             return f"❌ 更新任务状态时出错: {str(e)}"
 
     def delete_task(self, task_id):
         """删除任务（通过任务ID）"""
         try:
-            result = self.calendar_manager.delete_task(task_id)
-            return result.get("message", result.get("error", "删除完成"))
+            return self._reply(self.calendar_manager.delete_task(task_id), "删除完成")
         except Exception as e:
             return f"❌ 删除任务时出错: {str(e)}"
 
     def delete_task_by_title(self, title_keyword):
         """根据标题删除任务"""
         try:
-            result = self.calendar_manager.delete_task_by_title(title_keyword)
-            return result.get("message", result.get("error", "删除完成"))
+            return self._reply(self.calendar_manager.delete_task_by_title(title_keyword), "删除完成")
         except Exception as e:
             return f"❌ 按标题删除任务时出错: {str(e)}"
 
     def delete_tasks_by_time_range(self, start_date=None, end_date=None, show_completed=True):
         """按时间范围批量删除任务"""
         try:
-            print(f"🗑️ 按时间范围删除任务: {start_date} 到 {end_date}")
+            logger.debug("🗑️ 按时间范围删除任务: %s 到 %s", start_date, end_date)
 
             result = self.calendar_manager.delete_tasks_by_time_range(
                 start_date=start_date,
@@ -1481,32 +1969,32 @@ AI：```json
             )
 
             if result.get("success"):
-                print(f"✅ 时间范围删除任务成功")
+                logger.info("✅ 时间范围删除任务成功")
                 return result.get("message", "✅ 时间范围删除任务完成")
             else:
                 error_msg = result.get("error", "时间范围删除任务失败")
-                print(f"❌ 时间范围删除任务失败: {error_msg}")
+                logger.error("❌ 时间范围删除任务失败: %s", error_msg)
                 return f"❌ {error_msg}"
 
         except Exception as e:
             error_msg = f"❌ 按时间范围删除任务时出错: {str(e)}"
-            print(error_msg)
+            logger.error(error_msg)
             return error_msg
 
     def create_event(self, summary, description="", start_time=None, end_time=None,
                      reminder_minutes=30, priority="medium"):
         """创建Google日历事件"""
         try:
-            print(f"📅 开始创建日历事件: {summary}")
+            logger.debug("📅 开始创建日历事件: %s", summary)
 
             # 解析时间字符串
             start_dt = None
             end_dt = None
 
             if start_time:
-                start_dt = datetime.strptime(start_time, "%Y-%m-%d %H:%M")
+                start_dt = _parse_dt(start_time)
             if end_time:
-                end_dt = datetime.strptime(end_time, "%Y-%m-%d %H:%M")
+                end_dt = _parse_dt(end_time)
 
             result = self.calendar_manager.create_event(
                 summary=summary,
@@ -1518,16 +2006,16 @@ AI：```json
             )
 
             if result.get("success"):
-                print(f"✅ 日历事件创建成功: {summary}")
+                logger.info("✅ 日历事件创建成功: %s", summary)
                 return result.get("message", f"✅ 日历事件 '{summary}' 创建成功")
             else:
                 error_msg = result.get("error", "创建日历事件失败")
-                print(f"❌ 日历事件创建失败: {error_msg}")
+                logger.error("❌ 日历事件创建失败: %s", error_msg)
                 return f"❌ {error_msg}"
 
         except Exception as e:
             error_msg = f"❌ 创建日历事件时出错: {str(e)}"
-            print(error_msg)
+            logger.error(error_msg)
             return error_msg
 
     def query_events(self, days=30, max_results=20):
@@ -1546,34 +2034,39 @@ AI：```json
         except Exception as e:
             return f"❌ 查询日历事件时出错: {str(e)}"
 
+    async def query_all(self, days=7, max_results=20):
+        """同时查询日历事件和待办任务 - 两次Google API调用并发执行，耗时取两者中较长的一个"""
+        events_text, tasks_text = await asyncio.gather(
+            asyncio.to_thread(self.query_events, days, max_results),
+            asyncio.to_thread(self.query_tasks, False, max_results)
+        )
+        return f"{events_text}\n\n{tasks_text}"
+
     def update_event_status(self, event_id, status="completed"):
         """更新事件状态"""
         try:
-            result = self.calendar_manager.update_event_status(event_id, status)
-            return result.get("message", result.get("error", "状态更新完成"))
+            return self._reply(self.calendar_manager.update_event_status(event_id, status), "状态更新完成")
         except Exception as e:
             return f"❌ 更新事件状态时出错: {str(e)}"
 
     def delete_event(self, event_id):
         """删除日历事件"""
         try:
-            result = self.calendar_manager.delete_event(event_id)
-            return result.get("message", result.get("error", "删除完成"))
+            return self._reply(self.calendar_manager.delete_event(event_id), "删除完成")
         except Exception as e:
             return f"❌ 删除日历事件时出错: {str(e)}"
 
     def delete_event_by_summary(self, summary, days=30):
         """根据标题删除日历事件"""
         try:
-            result = self.calendar_manager.delete_event_by_summary(summary, days)
-            return result.get("message", result.get("error", "删除完成"))
+            return self._reply(self.calendar_manager.delete_event_by_summary(summary, days), "删除完成")
         except Exception as e:
             return f"❌ 按标题删除事件时出错: {str(e)}"
 
     def delete_events_by_time_range(self, start_date=None, end_date=None):
         """按时间范围批量删除日历事件"""
         try:
-            print(f"🗑️ 按时间范围删除日历事件: {start_date} 到 {end_date}")
+            logger.debug("🗑️ 按时间范围删除日历事件: %s 到 %s", start_date, end_date)
 
             result = self.calendar_manager.delete_events_by_time_range(
                 start_date=start_date,
@@ -1581,173 +2074,180 @@ AI：```json
             )
 
             if result.get("success"):
-                print(f"✅ 时间范围删除日历事件成功")
+                logger.info("✅ 时间范围删除日历事件成功")
                 return result.get("message", "✅ 时间范围删除日历事件完成")
             else:
                 error_msg = result.get("error", "时间范围删除日历事件失败")
-                print(f"❌ 时间范围删除日历事件失败: {error_msg}")
+                logger.error("❌ 时间范围删除日历事件失败: %s", error_msg)
                 return f"❌ {error_msg}"
 
         except Exception as e:
             error_msg = f"❌ 按时间范围删除日历事件时出错: {str(e)}"
-            print(error_msg)
+            logger.error(error_msg)
             return error_msg
 
     def extract_tool_call(self, llm_response):
         """从LLM响应中提取工具调用指令"""
-        print(f"🔍 解析LLM响应: {llm_response}")
+        logger.debug("🔍 解析LLM响应: %s", llm_response)
 
-        if "```json" in llm_response and "```" in llm_response:
-            try:
-                start = llm_response.find("```json") + 7
-                end = llm_response.find("```", start)
-                json_str = llm_response[start:end].strip()
-                print(f"📦 提取到JSON代码块: {json_str}")
-
-                tool_data = json.loads(json_str)
-                if isinstance(tool_data, dict) and "action" in tool_data and "parameters" in tool_data:
-                    print(f"✅ 成功解析工具调用: {tool_data['action']}")
-                    return tool_data
-            except json.JSONDecodeError as e:
-                print(f"❌ JSON解析失败: {e}")
-                return None
-            except Exception as e:
-                print(f"❌ 提取工具调用失败: {e}")
+        # 单次扫描：partition定位开头的```json，再在其后定位闭合的```
+        _, fence, rest = llm_response.partition("```json")
+        json_str, closing, _ = rest.partition("```")
+        if fence and closing:
+            json_str = json_str.strip()
+        else:
+            # 兼容未包裹代码块、直接返回JSON的情况
+            stripped = llm_response.strip()
+            if stripped[:1] != "{" or stripped[-1:] != "}":
+                logger.debug("未找到有效的工具调用")
                 return None
+            json_str = stripped
+        logger.debug("📦 提取到JSON代码块: %s", json_str)
 
-        print("❌ 未找到有效的工具调用")
+        try:
+            tool_data = orjson.loads(json_str)
+        except orjson.JSONDecodeError as e:
+            logger.warning("❌ JSON解析失败: %s", e)
+            return None
+
+        if isinstance(tool_data, dict) and tool_data.keys() >= {"action", "parameters"}:
+            logger.debug("✅ 成功解析工具调用: %s", tool_data["action"])
+            return tool_data
+
+        logger.debug("未找到有效的工具调用")
         return None
 
     async def call_tool(self, action, parameters):
         """统一工具调用入口 - 异步版本"""
-        print(f"🛠️ 调用工具: {action}")
-        print(f"📋 工具参数: {parameters}")
+        logger.info("🛠️ 调用工具: %s", action)
+        logger.debug("📋 工具参数: %s", parameters)
 
         try:
-            if action == "create_task":
-                return self.create_task(
-                    title=parameters.get("title", ""),
-                    notes=parameters.get("notes", ""),
-                    due_date=parameters.get("due_date"),
-                    reminder_minutes=parameters.get("reminder_minutes", 60),
-                    priority=parameters.get("priority", "medium")
-                )
-            elif action == "query_tasks":
-                return self.query_tasks(
-                    show_completed=parameters.get("show_completed", False),
-                    max_results=parameters.get("max_results", 20)
-                )
-            elif action == "update_task_status":
-                return self.update_task_status(
-                    task_id=parameters.get("task_id", ""),
-                    status=parameters.get("status", "completed")
-                )
-            elif action == "delete_task":
-                return self.delete_task(
-                    task_id=parameters.get("task_id", "")
-                )
-            elif action == "delete_task_by_title":
-                return self.delete_task_by_title(
-                    title_keyword=parameters.get("title_keyword", "")
-                )
-            elif action == "delete_tasks_by_time_range":
-                return self.delete_tasks_by_time_range(
-                    start_date=parameters.get("start_date"),
-                    end_date=parameters.get("end_date"),
-                    show_completed=parameters.get("show_completed", True)
-                )
-            elif action == "create_event":
-                return self.create_event(
-                    summary=parameters.get("summary", ""),
-                    description=parameters.get("description", ""),
-                    start_time=parameters.get("start_time"),
-                    end_time=parameters.get("end_time"),
-                    reminder_minutes=parameters.get("reminder_minutes", 30),
-                    priority=parameters.get("priority", "medium")
-                )
-            elif action == "query_events":
-                return self.query_events(
-                    days=parameters.get("days", 30),
-                    max_results=parameters.get("max_results", 20)
-                )
-            elif action == "update_event_status":
-                return self.update_event_status(
-                    event_id=parameters.get("event_id", ""),
-                    status=parameters.get("status", "completed")
-                )
-            elif action == "delete_event":
-                return self.delete_event(
-                    event_id=parameters.get("event_id", "")
-                )
-            elif action == "delete_event_by_summary":
-                return self.delete_event_by_summary(
-                    summary=parameters.get("summary", ""),
-                    days=parameters.get("days", 30)
-                )
-            elif action == "delete_events_by_time_range":
-                return self.delete_events_by_time_range(
-                    start_date=parameters.get("start_date"),
-                    end_date=parameters.get("end_date")
-                )
-            elif action == "generate_stock_report":
-                # 股票分析工具返回PDF二进制数据
-                pdf_binary = await self.generate_stock_report(parameters.get("stock_name", ""))
-                if pdf_binary:
-                    return {
-                        "success": True,
-                        "pdf_binary": pdf_binary,
-                        "message": f"✅ 股票分析报告生成成功，PDF大小: {len(pdf_binary)} 字节",
-                        "stock_name": parameters.get("stock_name", "")
-                    }
-                else:
-                    return {
-                        "success": False,
-                        "error": "❌ 股票分析报告生成失败"
-                    }
-            elif action == "get_weather":
-                return self.get_weather(parameters.get("city", ""))
-            elif action == "calculator":
-                return self.calculator(parameters.get("expression", ""))
-            elif action == "send_email":
-                return self.send_email(
-                    parameters.get("to", ""),
-                    parameters.get("subject", ""),
-                    parameters.get("body", "")
-                )
-            else:
-                result = f"未知工具：{action}"
+            tool = self._tools.get(action)
+            if tool is None:
+                return f"未知工具：{action}"
 
-            print(f"✅ 工具执行结果: {result}")
-            return result
+            handler, defaults, is_async = tool
+            kwargs = {name: parameters.get(name, default) for name, default in defaults.items()}
+            if is_async:
+                return await handler(**kwargs)
+            # 同步工具（Google API、天气、邮件）放到线程中执行，避免阻塞事件循环
+            return await asyncio.to_thread(handler, **kwargs)
 
         except Exception as e:
             error_msg = f"❌ 执行工具 {action} 时出错: {str(e)}"
-            print(error_msg)
+            logger.exception(error_msg)
             return error_msg
 
+    async def _stream_completion(self, messages):
+        """
+        流式获取LLM响应（异步版本）
+
+        一旦工具调用的JSON代码块闭合就提前结束，不再等待模型生成剩余的说明文字；
+        不是工具调用的```json代码块（如示例配置）照常读到结尾
+        """
+        stream = await self.client.chat.completions.create(
+            model=self.model_id,
+            messages=messages,
+            stream=True
+        )
+
+        # 增量扫描：只检查新到达的文本（回退几个字符以覆盖跨分片的围栏标记），
+        # 先定位开头的```json，再从其后寻找闭合的```
+        text = ""
+        fence_open = -1
+        min_open = 0  # 已确认不是工具调用的代码块之后，才继续寻找下一个```json
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                scan_from = len(text)
+                text += delta
+                while True:
+                    if fence_open < 0:
+                        fence_open = text.find("```json", max(min_open, scan_from - 6))
+                        if fence_open < 0:
+                            break
+                        scan_from = fence_open + 7
+                    fence_close = text.find("```", max(fence_open + 7, scan_from - 2))
+                    if fence_close < 0:
+                        break
+                    tool_block = text[fence_open:fence_close + 3]
+                    if self.extract_tool_call(tool_block) is not None:
+                        logger.debug("⚡ 工具调用代码块已闭合，提前结束流式响应")
+                        # 只返回工具调用代码块，前面的示例代码块不会干扰后续解析
+                        return tool_block
+                    fence_open = -1
+                    min_open = scan_from = fence_close + 3
+        finally:
+            await stream.close()
+
+        return text.strip()
+
+    def _cache_key(self, messages):
+        """回答缓存的键：模型ID与完整消息列表的摘要"""
+        return hashlib.blake2b(orjson.dumps([self.model_id, messages]), digest_size=16).digest()
+
+    async def _quick_reply(self, user_input):
+        """处理意图明确的简单输入，无法判断时返回None交给LLM"""
+        text = user_input.strip()
+        if not text:
+            return "请问有什么可以帮您？"
+        expression = _quick_calc_expression(text)
+        if expression is not None:
+            return await self.call_tool("calculator", {"expression": expression})
+        city = _quick_weather_city(text)
+        if city is not None:
+            return await self.call_tool("get_weather", {"city": city})
+        return None
+
     async def process_request(self, user_input):
         """处理用户请求（异步版本）"""
-        print(f"👤 用户输入: {user_input}")
+        logger.debug("👤 用户输入: %s", user_input)
+
+        if user_input and len(user_input) > MAX_INPUT_CHARS:
+            return {
+                "type": "text",
+                "content": f"输入过长（{len(user_input)} 字），请精简到 {MAX_INPUT_CHARS} 字以内",
+                "success": False
+            }
+
+        quick = await self._quick_reply(user_input or "")
+        if quick is not None:
+            logger.debug("⚡ 命中快速通道，跳过LLM调用")
+            return {
+                "type": "text",
+                "content": str(quick),
+                "success": True
+            }
 
         messages = [
-            {"role": "system", "content": self.system_prompt},
+            self._system_message,
             {"role": "user", "content": user_input}
         ]
 
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model_id,
-                messages=messages,
-                stream=False
-            )
+        cache_key = self._cache_key(messages)
+        cached = _RESPONSE_CACHE.get(cache_key)
+        if cached is not None:
+            logger.debug("♻️ 命中回答缓存")
+            return {
+                "type": "text",
+                "content": cached,
+                "success": True
+            }
 
-            llm_response = response.choices[0].message.content.strip()
-            print(f"🤖 LLM原始响应: {llm_response}")
+        try:
+            async with _LLM_SEMAPHORE:
+                llm_response = await self._stream_completion(messages)
+            logger.debug("🤖 LLM原始响应: %s", llm_response)
 
             # 检查工具调用
             tool_data = self.extract_tool_call(llm_response)
             if tool_data:
-                print(f"🔧 检测到工具调用: {tool_data['action']}")
+                logger.debug("🔧 检测到工具调用: %s", tool_data["action"])
                 tool_result = await self.call_tool(tool_data["action"], tool_data["parameters"])
 
                 # 特殊处理股票分析工具，返回PDF二进制数据
@@ -1768,7 +2268,9 @@ AI：```json
                         "success": True
                     }
             else:
-                print("💬 无工具调用，直接返回LLM响应")
+                logger.debug("💬 无工具调用，直接返回LLM响应")
+                if llm_response:
+                    _RESPONSE_CACHE.set(cache_key, llm_response)
                 return {
                     "type": "text",
                     "content": llm_response,
@@ -1777,7 +2279,7 @@ AI：```json
 
         except Exception as e:
             error_msg = f"处理请求时出错：{str(e)}"
-            print(f"❌ {error_msg}")
+            logger.exception("❌ %s", error_msg)
             return {
                 "type": "text",
                 "content": error_msg,
@@ -1785,13 +2287,53 @@ AI：```json
             }
 
 
+_AGENT = None
+_AGENT_LOCK = threading.Lock()
+
+
+def get_agent():
+    """获取共享的智能助手实例 - 首次使用时创建，之后所有请求复用"""
+    global _AGENT
+    if _AGENT is None:
+        # 双重检查：启动预热线程与首个请求并发时只创建一次
+        with _AGENT_LOCK:
+            if _AGENT is None:
+                _AGENT = DeepseekAgent()
+    return _AGENT
+
+
 async def smart_assistant(user_input):
     """智能助手主函数 - 异步版本"""
-    agent = DeepseekAgent()
+    # 首次创建要做Google认证（可能与启动预热争用锁），放到线程中，避免卡住事件循环
+    agent = _AGENT if _AGENT is not None else await asyncio.to_thread(get_agent)
     result = await agent.process_request(user_input)
     return result
 
 
+async def smart_assistant_batch(user_inputs, concurrency=5):
+    """
+    批量处理多条用户输入 - 有界并发
+
+    返回结果列表，顺序与输入一致；单条处理抛出的异常以异常对象形式返回
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _process_one(user_input):
+        async with semaphore:
+            return await smart_assistant(user_input)
+
+    return await asyncio.gather(*(_process_one(x) for x in user_inputs), return_exceptions=True)
+
+
+async def shutdown():
+    """关闭后台资源 - 等待排队中的邮件发送完成，并关闭方舟客户端的连接池"""
+    await asyncio.to_thread(_MAIL_EXECUTOR.shutdown, wait=True)
+    # 只关闭已创建的客户端，避免为了关闭而新建一个
+    if get_ark_client.cache_info().currsize:
+        await get_ark_client().close()
+        get_ark_client.cache_clear()
+
+
 async def test_playwright_async():
     """异步测试Playwright功能"""
     try:
@@ -1831,10 +2373,14 @@ async def test_all_features():
     print("🧪 测试所有功能")
     print("=" * 50)
 
-    for i, test_case in enumerate(test_cases, 1):
+    # 所有用例并发执行，结果按输入顺序返回
+    results = await smart_assistant_batch(test_cases)
+
+    for i, (test_case, result) in enumerate(zip(test_cases, results), 1):
         print(f"\n{i}. 测试: {test_case}")
         try:
-            result = await smart_assistant(test_case)
+            if isinstance(result, Exception):
+                raise result
             if result["type"] == "stock_pdf":
                 print(f"✅ 股票分析报告生成成功")
                 print(f"   股票名称: {result.get('stock_name')}")
@@ -41,16 +41,37 @@ processing_tasks = {}
 pdf_storage = {}
 
 
+async def warm_up_agent():
+    """后台预先创建全局智能助手，首个用户请求无需等待Google认证和客户端初始化"""
+    try:
+        await asyncio.to_thread(agent_tools.get_agent)
+        app_logger.info("✅ 智能助手已初始化")
+    except Exception as e:
+        app_logger.warning(f"⚠️ 智能助手预初始化失败，将在首次请求时重试: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """FastAPI 生命周期事件管理器"""
     # 启动时执行的操作
     app_logger.info("🚀 钉钉机器人服务启动中...")
+    missing = [name for name, value in (
+        ("ARK_API_KEY", agent_tools.ARK_API_KEY),
+        ("ROBOT_ACCESS_TOKEN", ROBOT_ACCESS_TOKEN),
+        ("ROBOT_SECRET", ROBOT_SECRET),
+    ) if not value]
+    if missing:
+        app_logger.warning(f"⚠️ 缺少环境变量: {', '.join(missing)}")
+    # 预热放到后台：Google认证可能卡在交互式授权上，不能阻塞服务启动和健康检查
+    warmup_task = asyncio.create_task(warm_up_agent())
     yield
     # 关闭时执行的操作
     app_logger.info("🛑 钉钉机器人服务关闭中...")
+    warmup_task.cancel()
     thread_pool.shutdown(wait=True)
     app_logger.info("✅ 线程池已关闭")
+    await agent_tools.shutdown()
+    app_logger.info("✅ 邮件队列已清空，LLM连接池已关闭")
 
 
 # 初始化FastAPI应用
@@ -65,6 +86,12 @@ app = FastAPI(
 ROBOT_ACCESS_TOKEN = os.getenv('ROBOT_ACCESS_TOKEN')
 ROBOT_SECRET = os.getenv('ROBOT_SECRET')
 
+# 七牛云配置 - 启动时读取一次，缺失时为空字符串而不是在上传时崩溃
+QINIU_ACCESS_KEY = (os.getenv("Qiniu_ACCESS_KEY") or "").strip()
+QINIU_SECRET_KEY = (os.getenv("Qiniu_SECRET_KEY") or "").strip()
+QINIU_BUCKET_NAME = (os.getenv("Qiniu_BUCKET_NAME") or "").strip()
+QINIU_DOMAIN = (os.getenv("Qiniu_DOMAIN") or "").strip()
+
 
 def generate_dingtalk_signature(timestamp: str, secret: str) -> str:
     """生成钉钉机器人签名"""
@@ -235,16 +262,18 @@ async def upload_file_to_Qiniu(pdf_binary: bytes, stock_name: str, at_user_ids=N
     :param stock_name: 股票名称
     :return: 上传成功返回文件的公开访问URL，失败返回None
     """
+    if not (QINIU_ACCESS_KEY and QINIU_SECRET_KEY and QINIU_BUCKET_NAME and QINIU_DOMAIN):
+        app_logger.error("错误：七牛云配置不完整")
+        return None
+
     # 初始化七牛云上传器
-    access_key = os.environ.get("Qiniu_ACCESS_KEY").strip()
-    secret_key = os.environ.get("Qiniu_SECRET_KEY").strip()
-    bucket_name = os.environ.get("Qiniu_BUCKET_NAME").strip()
-    domain = os.environ.get("Qiniu_DOMAIN").strip()
-    q = Auth(access_key, secret_key)
+    bucket_name = QINIU_BUCKET_NAME
+    domain = QINIU_DOMAIN
+    q = Auth(QINIU_ACCESS_KEY, QINIU_SECRET_KEY)
     try:
         # 检查二进制数据是否为空
         if not pdf_binary:
-            print("错误：PDF二进制数据为空")
+            app_logger.error("错误：PDF二进制数据为空")
             return None
 
         timestamp = datetime.now().strftime("%Y%m%d")
@@ -253,27 +282,27 @@ async def upload_file_to_Qiniu(pdf_binary: bytes, stock_name: str, at_user_ids=N
         # 简单验证PDF文件头（可选，但推荐）
         pdf_header = b'%PDF-'
         if not pdf_binary.startswith(pdf_header):
-            print("警告：提供的二进制数据可能不是有效的PDF文件")
+            app_logger.warning("警告：提供的二进制数据可能不是有效的PDF文件")
 
         # 生成上传Token
         token = q.upload_token(bucket_name, remote_file_name,
                                     3600)
 
-        # 执行上传（使用put_data上传二进制数据）
-        ret, info = put_data(token, remote_file_name, pdf_binary)
+        # 执行上传（put_data是阻塞调用，放到线程中执行，避免上传期间卡住事件循环）
+        ret, info = await asyncio.to_thread(put_data, token, remote_file_name, pdf_binary)
 
         # 检查上传结果
         if ret is not None and ret['key'] == remote_file_name:
             # 生成公开访问URL
             file_url = f"Test1: 文件上传成功！访问链接：http://{domain}/{remote_file_name}"
-            print(f"文件上传成功！访问链接：http://{domain}/{remote_file_name}")
+            app_logger.info(f"文件上传成功！访问链接：http://{domain}/{remote_file_name}")
             await send_official_message(file_url, at_user_ids=at_user_ids)
             return True
         else:
-            print(f"文件上传失败：{info}")
+            app_logger.error(f"文件上传失败：{info}")
             return None
     except Exception as e:
-        print(f"上传过程中发生错误：{str(e)}")
+        app_logger.error(f"上传过程中发生错误：{str(e)}")
         return None
 
 async def sync_llm_processing(conversation_id, user_input, at_user_ids):
@@ -281,8 +310,7 @@ async def sync_llm_processing(conversation_id, user_input, at_user_ids):
     try:
         app_logger.info(f"开始处理LLM请求: {user_input}")
 
-        ark_key = os.environ.get('ARK_API_KEY')
-        if not ark_key:
+        if not agent_tools.ARK_API_KEY:
             error_msg = "Test1：ARK_API_KEY未设置"
             await send_official_message(error_msg, at_user_ids=at_user_ids)
             return
@@ -345,16 +373,13 @@ async def async_process_llm_message(conversation_id, user_input, at_user_ids):
 async def send_official_message(msg, at_user_ids=None, at_mobiles=None, is_at_all=False):
     """发送钉钉消息"""
     try:
+        if not ROBOT_ACCESS_TOKEN or not ROBOT_SECRET:
+            return False
+
         timestamp = str(round(time.time() * 1000))
         sign = generate_dingtalk_signature(timestamp, ROBOT_SECRET)
 
-        robot_token = os.environ.get('ROBOT_ACCESS_TOKEN')
-        robot_secret = os.environ.get('ROBOT_SECRET')
-
-        if not robot_token or not robot_secret:
-            return False
-
-        url = f'https://oapi.dingtalk.com/robot/send?access_token={robot_token}&timestamp={timestamp}&sign={sign}'
+        url = f'https://oapi.dingtalk.com/robot/send?access_token={ROBOT_ACCESS_TOKEN}&timestamp={timestamp}&sign={sign}'
 
         body = {
             "at": {
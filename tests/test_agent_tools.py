@@ -0,0 +1,137 @@
+import asyncio
+import types
+
+import pytest
+
+import agent_tools
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("1 + 2 * 3", 7),
+    ("2 ** 200", 2 ** 200),
+    ("2 ** -3", 0.125),
+    ("1 ** 99999999", 1),
+])
+def test_calculator_evaluates_arithmetic(expression, expected):
+    assert agent_tools._evaluate_expression(expression) == expected
+
+
+@pytest.mark.parametrize("expression", [
+    "(((9**99)**99)**99)**99",
+    "9**99**99",
+    "(-2)**20000",
+])
+def test_calculator_rejects_huge_powers_before_computing(expression):
+    with pytest.raises(ValueError):
+        agent_tools._evaluate_expression(expression)
+
+
+@pytest.mark.parametrize("text", ["1+2", "(5-3)*2", "3 * 4 - 1", "100/4+1"])
+def test_quick_calc_matches_arithmetic(text):
+    assert agent_tools._quick_calc_expression(text) == text
+
+
+@pytest.mark.parametrize("text", [
+    "138-1234-5678", "2024-10", "2024-10-01", "10-3", "2024/10/01", "10/1", "(1+2",
+])
+def test_quick_calc_leaves_dates_and_unparsable_input_to_llm(text):
+    assert agent_tools._quick_calc_expression(text) is None
+
+
+@pytest.mark.parametrize("text, city", [
+    ("北京天气", "北京"),
+    ("查询上海的天气", "上海"),
+    ("乌鲁木齐天气？", "乌鲁木齐"),
+    ("天津天气", "天津"),
+])
+def test_quick_weather_extracts_known_city(text, city):
+    assert agent_tools._quick_weather_city(text) == city
+
+
+@pytest.mark.parametrize("text", [
+    "今日天气", "现在天气", "周末天气", "北京今日天气",
+    "这里天气", "这边天气", "外面天气", "国庆天气", "春节天气", "今年天气",
+])
+def test_quick_weather_leaves_unknown_places_to_llm(text):
+    assert agent_tools._quick_weather_city(text) is None
+
+
+class _FakeStream:
+    """按给定分片产出的假流式响应，记录是否被关闭"""
+
+    def __init__(self, deltas):
+        self._deltas = deltas
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for delta in self._deltas:
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=delta))])
+
+    async def close(self):
+        self.closed = True
+
+
+def _agent_with_stream(deltas):
+    stream = _FakeStream(deltas)
+
+    async def create(**kwargs):
+        return stream
+
+    agent = agent_tools.DeepseekAgent.__new__(agent_tools.DeepseekAgent)
+    agent.model_id = "test-model"
+    agent.client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))
+    return agent, stream
+
+
+def _split(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+TOOL_BLOCK = '```json\n{"action": "get_weather", "parameters": {"city": "北京"}}\n```'
+EXAMPLE_ANSWER = '下面是示例配置：\n```json\n{"name": "demo"}\n```\n第二步：把它保存为 config.json。'
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 100])
+def test_stream_stops_after_split_tool_block(size):
+    agent, stream = _agent_with_stream(_split("好的\n" + TOOL_BLOCK + "\n我将为您查询天气，请稍候。", size))
+    assert asyncio.run(agent._stream_completion([])) == TOOL_BLOCK
+    assert stream.closed
+
+
+@pytest.mark.parametrize("size", [1, 3, 100])
+def test_stream_skips_example_block_before_tool_call(size):
+    agent, _ = _agent_with_stream(_split(EXAMPLE_ANSWER + "\n" + TOOL_BLOCK + "\n后续说明", size))
+    result = asyncio.run(agent._stream_completion([]))
+    assert result == TOOL_BLOCK
+    assert agent.extract_tool_call(result)["action"] == "get_weather"
+
+
+@pytest.mark.parametrize("size", [1, 4, 100])
+def test_stream_reads_plain_answer_to_the_end(size):
+    agent, _ = _agent_with_stream(_split(EXAMPLE_ANSWER, size))
+    result = asyncio.run(agent._stream_completion([]))
+    assert result == EXAMPLE_ANSWER
+    assert agent.extract_tool_call(result) is None
+
+
+@pytest.mark.parametrize("response", [
+    "好的\n" + TOOL_BLOCK,
+    '{"action": "get_weather", "parameters": {"city": "北京"}}',
+])
+def test_extract_tool_call_accepts_fenced_and_bare_json(response):
+    agent = agent_tools.DeepseekAgent.__new__(agent_tools.DeepseekAgent)
+    assert agent.extract_tool_call(response) == {"action": "get_weather", "parameters": {"city": "北京"}}
+
+
+@pytest.mark.parametrize("response", [
+    "今天天气不错",
+    '```json\n{"name": "demo"}\n```',
+    '```json\n{"action": "get_weather", \n```',
+    '{"action": "get_weather"}',
+])
+def test_extract_tool_call_rejects_non_tool_output(response):
+    agent = agent_tools.DeepseekAgent.__new__(agent_tools.DeepseekAgent)
+    assert agent.extract_tool_call(response) is None